@@ -0,0 +1,198 @@
+# agent_loop.py
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import json_codec
+from deadlines import cap
+from messages import AIMessage, Message, ToolMessage
+from telemetry import metrics, span
+from tool_registry import Tool, ToolRegistry
+
+# Returned to the user when the model keeps asking for tools after the step budget is used up
+BUDGET_EXHAUSTED_RESPONSE = "I wasn't able to finish answering within the allowed number of steps."
+
+TOOL_CALL_SECONDS = metrics.histogram("tool_call_seconds", "Duration of tool calls", ("tool", "outcome"))
+
+
+def extract_llm_response(llm_response):
+    """
+    Extracts the role, content, and tool_calls from the LLM response and returns an AIMessage object.
+
+    Parameters:
+        llm_response (dict): The LLM response in JSON format (as a Python dictionary).
+
+    Returns:
+        AIMessage: An instance of AIMessage with role, content, and tool_calls populated.
+    """
+    try:
+        message_data = llm_response.get('choices', [{}])[0].get('message', {})
+        content = message_data.get('content', '')
+        tool_calls = message_data.get('tool_calls', [])
+        return AIMessage(content=content, tool_calls=tool_calls)
+    except Exception as e:
+        print(f"Error extracting LLM response: {e}")
+        return AIMessage(content="There was an error processing the response.")
+
+
+class ToolRunner:
+    """
+    Runs the tool calls of one model response concurrently.
+    Arguments are checked and coerced by the tool's compiled validator before anything runs, so a
+    malformed call is answered with an error the model can correct instead of a failed request.
+    Tools run through their awaitable acall, so blocking tools go to the shared tool thread pool and
+    per-tool concurrency limits apply. Tools without a declared timeout get the runner's default, and
+    no tool is given longer than the time left before the turn's deadline (see deadlines).
+    Results keep the order of the tool calls.
+    """
+
+    def __init__(self, tool_registry: ToolRegistry, timeout: float = 30.0):
+        self.tool_registry = tool_registry
+        self.timeout = timeout
+
+    def _parse_arguments(self, tool: Tool, raw_arguments):
+        if isinstance(raw_arguments, str):
+            try:
+                raw_arguments = json_codec.loads(raw_arguments) if raw_arguments.strip() else {}
+            except json_codec.DecodeError:
+                return None, ["arguments are not valid JSON"]
+        return tool.validate(raw_arguments)
+
+    def check_tool_call(self, call):
+        """
+        Look up the tool of a call and validate its arguments. Returns (tool, arguments, errors).
+        """
+        function_name = call['function']['name']
+        tool = self.tool_registry.get(function_name)
+        if tool is None:
+            return None, None, [f"unknown tool, available tools are: {', '.join(self.tool_registry.names())}"]
+        arguments, errors = self._parse_arguments(tool, call['function'].get('arguments'))
+        return tool, arguments, errors
+
+    async def run_tool_call(self, call):
+        function_name = call['function']['name']
+        tool, arguments, errors = self.check_tool_call(call)
+
+        # Names the model made up are reported as unknown so they don't become metric labels
+        with span("tool", TOOL_CALL_SECONDS, tool=tool.name if tool else "unknown", call_id=call.get("id")) as tool_span:
+            if errors:
+                result = f"Error: The tool call for '{function_name}' was rejected: {'; '.join(errors)}."
+                tool_span.set(outcome="rejected")
+                print(result)
+            else:
+                # Tools with a declared timeout enforce it themselves, but none may outlive the turn's deadline
+                timeout = cap(tool.timeout or self.timeout)
+                try:
+                    pending = tool.invoke(arguments)
+                    result = await (pending if timeout == tool.timeout else asyncio.wait_for(pending, timeout))
+                    print(f"Result from {function_name}: {result}")
+                except asyncio.TimeoutError:
+                    result = f"Error: The tool call for '{function_name}' timed out after {timeout:g} seconds."
+                    tool_span.set(outcome="timeout")
+                    print(result)
+                except Exception as e:
+                    result = f"Error: The tool call for '{function_name}' failed: {e}"
+                    tool_span.set(outcome="error", error=str(e))
+                    print(result)
+
+        return ToolMessage(content=result, tool_call_id=call["id"])
+
+    async def add_tool_results(self, tool_calls):
+        # gather keeps results in the original tool_call_id order
+        return list(await asyncio.gather(*(self.run_tool_call(call) for call in tool_calls)))
+
+
+class AgentTurnResult:
+    def __init__(self, content: str, stop_reason: str, steps: List[Dict], total_seconds: float, total_tokens: int):
+        self.content = content
+        self.stop_reason = stop_reason
+        self.steps = steps
+        self.total_seconds = total_seconds
+        self.total_tokens = total_tokens
+
+    def to_dict(self):
+        return {
+            "stop_reason": self.stop_reason,
+            "total_seconds": round(self.total_seconds, 3),
+            "total_tokens": self.total_tokens,
+            "steps": self.steps,
+        }
+
+
+class AgentLoop:
+    """
+    Runs one user turn as model -> tools -> model ... until the model answers without tool calls
+    or the step, time or token budget is used up. Once the budget is exhausted the model is asked
+    for a final answer without tools. Every step records how long the model and the tools took.
+
+    The caller supplies how to talk to the model, so the same loop serves the web app and the CLI:
+        send(messages, allow_tools) -> response dict, or None on error
+        on_messages(messages): called after messages were appended, e.g. to persist them
+        on_tool_calls(tool_calls): awaited before a round of tools runs, e.g. to report progress
+        on_tool_results(tool_calls): awaited after the round of tools finished
+    """
+
+    def __init__(self, tool_runner: ToolRunner, max_steps: int = 5, max_seconds: float = 120.0, max_tokens: int = 0):
+        self.tool_runner = tool_runner
+        self.max_steps = max(1, max_steps)
+        self.max_seconds = max_seconds
+        self.max_tokens = max_tokens
+
+    async def run(self, messages: List[Message], send: Callable[[List[Message], bool], Awaitable[Optional[dict]]],
+                  on_messages: Optional[Callable[[List[Message]], None]] = None,
+                  on_tool_calls: Optional[Callable[[List[Dict]], Awaitable[None]]] = None,
+                  on_tool_results: Optional[Callable[[List[Dict]], Awaitable[None]]] = None) -> AgentTurnResult:
+        started = time.monotonic()
+        steps = []
+        total_tokens = 0
+        stop_reason = "max_steps"
+
+        def result(content, reason):
+            return AgentTurnResult(content, reason, steps, time.monotonic() - started, total_tokens)
+
+        for step in range(1, self.max_steps + 1):
+            allow_tools = step < self.max_steps and stop_reason == "max_steps"
+            step_timing = {"step": step}
+            steps.append(step_timing)
+
+            llm_started = time.monotonic()
+            response_data = await send(messages, allow_tools)
+            step_timing["llm_seconds"] = round(time.monotonic() - llm_started, 3)
+            if not response_data:
+                return result("Error processing the request." if step == 1 else "Error during final processing.", "error")
+
+            usage = response_data.get("usage") or {}
+            tokens = usage.get("total_tokens") or (usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0))
+            step_timing["tokens"] = tokens
+            total_tokens += tokens
+
+            ai_message = extract_llm_response(response_data)
+            if ai_message.tool_calls and not allow_tools:
+                # Out of budget: keep the answer but drop tool calls that will never get results
+                ai_message = AIMessage(content=ai_message.content or BUDGET_EXHAUSTED_RESPONSE)
+            messages.append(ai_message)
+            if on_messages:
+                on_messages(messages)
+
+            if not ai_message.tool_calls:
+                return result(ai_message.content, "done" if allow_tools else stop_reason)
+
+            if on_tool_calls:
+                await on_tool_calls(ai_message.tool_calls)
+            tools_started = time.monotonic()
+            tool_messages = await self.tool_runner.add_tool_results(ai_message.tool_calls)
+            step_timing["tool_calls"] = len(ai_message.tool_calls)
+            step_timing["tool_seconds"] = round(time.monotonic() - tools_started, 3)
+            messages.extend(tool_messages)
+            if on_messages:
+                on_messages(messages)
+            if on_tool_results:
+                await on_tool_results(ai_message.tool_calls)
+
+            # Stop offering tools once the time or token budget is spent, so the next step answers
+            if self.max_seconds and time.monotonic() - started >= self.max_seconds:
+                stop_reason = "max_seconds"
+            elif self.max_tokens and total_tokens >= self.max_tokens:
+                stop_reason = "max_tokens"
+
+        return result(BUDGET_EXHAUSTED_RESPONSE, stop_reason)
@@ -1,51 +1,81 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, List
-import requests
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from contextlib import asynccontextmanager
+import asyncio
 import json
+import time
 import uuid
 import os
 from dotenv import load_dotenv
+from llm_client import LLMError, STREAM_FIELDS
+from llm_router import create_llm_router
+from prompt_cache import PromptPrefix
+from session_store import create_session_store
+from concurrency import AdmissionController, Overloaded, SessionLocks
+from ws_hub import create_connection_hub
+from chat_protocol import TurnEvents, parse_client_frame
+from deadlines import deadline
+from telemetry import current_span, metrics, setup_tracing, shutdown_tracing, span
+import http_pool
 
 # Load environment variables from .env file
 load_dotenv()
 
-app = FastAPI()
-
-# In-memory storage for session-based conversation history
-session_store: Dict[str, List[Dict]] = {}
+async def purge_expired_sessions():
+    # Periodically drop idle sessions so they don't accumulate
+    while True:
+        await asyncio.sleep(float(os.getenv("SESSION_PURGE_INTERVAL", "300")))
+        try:
+            removed = await asyncio.to_thread(session_store.purge_expired)
+            if removed:
+                print(f"Purged {removed} expired sessions")
+        except Exception as e:
+            print(f"Error purging expired sessions: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    setup_tracing()
+    purge_task = asyncio.create_task(purge_expired_sessions())
+    await manager.start()
+    await llm_router.start()
+    yield
+    purge_task.cancel()
+    await manager.close()
+    session_store.close()
+    # Close the pooled LLM and tool connections and tool threads on shutdown
+    await llm_router.close()
+    await http_pool.close_session()
+    tool_decorator.shutdown_executor()
+    shutdown_tracing()
+
+app = FastAPI(lifespan=lifespan)
+
+# Storage for session-based conversation history (in-memory LRU or SQLite, see SESSION_BACKEND)
+session_store = create_session_store()
 
 # Define the UserInput model
 class UserInput(BaseModel):
     session_id: str
     message: str
 
-# WebSocket manager to handle connections and messages
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
-
-    async def connect(self, websocket: WebSocket, session_id: str):
-        await websocket.accept()
-        self.active_connections[session_id] = websocket
-
-    def disconnect(self, session_id: str):
-        self.active_connections.pop(session_id, None)
-
-    async def send_personal_message(self, message: str, session_id: str):
-        websocket = self.active_connections.get(session_id)
-        if websocket:
-            await websocket.send_text(message)
-
-manager = ConnectionManager()
-
-# Replace with your actual functions and imports
-from tool_weather import get_weather
-from tool_wikipedia import lookup_wikipedia
-from tool_internet_search import search_duckduckgo
-from tool_searxng_search import search_searxng
-from messages import AIMessage, UserMessage, ToolMessage, SystemMessage  # Import the message classes
+# WebSocket hub: any number of sockets per session, queued sends, shared between workers (see WS_BACKEND)
+manager = create_connection_hub()
+
+# Importing the tool modules registers their tools
+import tool_decorator
+import tool_weather
+import tool_wikipedia
+import tool_internet_search
+import tool_searxng_search
+from tool_registry import registry
+from messages import AIMessage, Message, ToolMessage, UserMessage, SystemMessage  # Import the message classes
+from tool_cache import cache_stats
+from context_window import ContextWindow
+from agent_loop import AgentLoop, ToolRunner
+from response_cache import create_response_cache
+from model_routing import ToolSelectionRouter
 
 # Define the OpenAI endpoint and API key
 api_url = os.getenv("API_URL", "http://ai.mtcl.lan:11436/v1/chat/completions")
@@ -54,35 +84,67 @@ api_key = os.getenv("API_KEY", "default_api_key")
 # Define the model being used
 model = os.getenv("MODEL", "llama3.1:8b-instruct-q8_0") #llama3.1:70b 
 
-# Make the request to the OpenAI API
-headers = {
-    "Content-Type": "application/json",
-    "Authorization": f"Bearer {api_key}"
-}
-
-# Collect tool definitions from decorated functions
-tools = [get_weather.tool_definition,
-         lookup_wikipedia.tool_definition,
-        #  search_duckduckgo.tool_definition,
-         search_searxng.tool_definition
-         ]
-
-# Define a dictionary of tool functions
-tool_functions = {
-    "get_weather": get_weather,
-    "lookup_wikipedia": lookup_wikipedia,
-    # "search_duckduckgo": search_duckduckgo,
-    "search_searxng": search_searxng
-}
+# Optional small, fast model that picks tools so the main model mostly writes answers (see model_routing)
+small_model = os.getenv("LLM_SMALL_MODEL", "").strip() or None
+
+# LLM backends (API_URL, or several from LLM_BACKENDS) with load-aware routing, health checks and
+# session affinity; each backend has its own keep-alive connection pool
+llm_router = create_llm_router(api_url, model, api_key)
+
+# Token budget for the conversation history sent to the model
+context_window = ContextWindow(
+    max_tokens=int(os.getenv("CONTEXT_TOKEN_BUDGET", "8000")),
+    tool_result_chars=int(os.getenv("CONTEXT_TOOL_RESULT_CHARS", "1500")),
+)
+
+# Turns of one session run in order; LLM requests across all sessions are capped with a bounded queue
+session_locks = SessionLocks(max_pending=int(os.getenv("SESSION_MAX_PENDING", "4")))
+admission = AdmissionController(
+    max_concurrent=int(os.getenv("LLM_MAX_CONCURRENT", "8")),
+    max_waiting=int(os.getenv("LLM_MAX_WAITING", "32")),
+)
+
+# Opt-in cache of answers to first questions of a session, matched by similarity (see RESPONSE_CACHE)
+response_cache = create_response_cache()
+
+# Seconds a tool call may take unless the tool declares its own timeout
+tool_timeout = float(os.getenv("TOOL_TIMEOUT", "30"))
+
+# Hard limit in seconds for a whole turn; LLM requests, tools and page fetches are cut off when it passes
+turn_deadline = float(os.getenv("TURN_DEADLINE", "300"))
+
+# Seconds between checks whether the client of a running /chat/ request is still connected
+DISCONNECT_POLL_INTERVAL = 0.5
+
+# Stream tokens to the session's WebSocket as they are generated
+stream_responses = os.getenv("STREAM_RESPONSES", "true").lower() in ("1", "true", "yes")
+
+# Tools offered to the model, picked from the registry by name
+tool_registry = registry.subset(
+    name.strip() for name in os.getenv("TOOLS", "get_weather,get_weather_many,lookup_wikipedia,lookup_wikipedia_many,search_searxng").split(",") if name.strip()
+)
+tools = tool_registry.definitions()
+
+# Model -> tools -> model loop shared with the CLI, with a step, time and token budget per turn
+agent_loop = AgentLoop(
+    ToolRunner(tool_registry, timeout=tool_timeout),
+    max_steps=int(os.getenv("AGENT_MAX_STEPS", "5")),
+    max_seconds=float(os.getenv("AGENT_MAX_SECONDS", "120")),
+    max_tokens=int(os.getenv("AGENT_MAX_TOKENS", "0")),
+)
+tool_selection = ToolSelectionRouter(
+    agent_loop.tool_runner,
+    policy=os.getenv("LLM_SMALL_MODEL_POLICY", "first_step").lower() if small_model else "off",
+)
 
 SYSTEM_MESSAGE_CONTENT = """
 You are a highly capable AI assistant with the ability to handle a wide variety of topics and tasks.
 Your primary responsibility is to assist users with general knowledge, reasoning, and conversational abilities.
 You have access to the following tools, and you may use multiple tools to achieve the same purpose when necessary:
 
-1. **Weather Tool**: Use this tool only when the user's query explicitly requests weather information, such as current conditions, forecasts, or climate data for a specific location. Ensure that the location is specified correctly when using this tool.
+1. **Weather Tool**: Use this tool only when the user's query explicitly requests weather information, such as current conditions, forecasts, or climate data for a specific location. Ensure that the location is specified correctly when using this tool. When the user asks about several locations, such as comparing cities, request them all in one call with the multi-location weather tool.
 
-2. **Wikipedia Tool**: This tool allows you to look up general information on Wikipedia. Use this tool when the user asks for specific factual information that is likely to be found in an encyclopedia, such as historical events, biographies, definitions, or scientific facts. Format the query accurately to retrieve the most relevant information.
+2. **Wikipedia Tool**: This tool allows you to look up general information on Wikipedia. Use this tool when the user asks for specific factual information that is likely to be found in an encyclopedia, such as historical events, biographies, definitions, or scientific facts. Format the query accurately to retrieve the most relevant information. When the user asks about several topics, such as comparing people or places, look them all up in one call with the multi-topic Wikipedia tool.
 
 3. **Searxng Search Tool**: This tool enables you to perform a web search. Use this tool when the user requests information that is more current, trending, or might not be found in a static encyclopedia, such as news, recent events, or niche queries. Ensure that the search query is specific and relevant to yield accurate results.
 
@@ -96,120 +158,316 @@ Your goal is to provide helpful, relevant, and direct responses based on the use
 Avoid unnecessary tool usage to maintain an efficient and natural conversation.
 """
 
-def extract_llm_response(llm_response):
+# Model, tools and system message serialized once per model served by the backends; requests only append the conversation
+system_message = SystemMessage(SYSTEM_MESSAGE_CONTENT)
+cache_hints = [hint.strip() for hint in os.getenv("LLM_CACHE_HINTS", "ollama").split(",") if hint.strip()]
+prompt_prefixes = {
+    backend_model: PromptPrefix(backend_model, tools, system_message, cache_hints=cache_hints,
+                                keep_alive=os.getenv("LLM_KEEP_ALIVE", "-1"))
+    for backend_model in dict.fromkeys(llm_router.models + ([small_model] if small_model else []))
+}
+
+TURN_SECONDS = metrics.histogram("chat_turn_seconds", "Duration of chat turns", ("stop_reason", "outcome"))
+LLM_QUEUE_SECONDS = metrics.histogram("llm_queue_wait_seconds", "Time LLM requests waited for an admission slot")
+metrics.gauge("llm_requests_active", "LLM requests running", lambda: admission.active)
+metrics.gauge("llm_requests_waiting", "LLM requests waiting for a slot", lambda: admission.waiting)
+metrics.gauge("ws_connections", "Open WebSockets in this worker", lambda: manager.stats()["connections"])
+
+async def send_request(messages, events: TurnEvents, allow_tools: bool = True, stream: bool = False,
+                       model: Optional[str] = None):
+    fields = dict(STREAM_FIELDS) if stream else {}
+    if not allow_tools:
+        # Keep the tool definitions so the prompt is unchanged, but ask for a plain answer
+        fields["tool_choice"] = "none"
+
+    def build(backend):
+        return prompt_prefixes[model or backend.model].build(messages, cache_key=events.session_id, **fields)
+
+    await events.status("Sending request to AI model...")
+    with span("llm", allow_tools=allow_tools, stream=stream) as llm_span:
+        try:
+            queued = time.monotonic()
+            # The turn was admitted before it changed the session, so its requests queue rather than fail
+            async with admission.slot(reject=False):
+                queue_wait = time.monotonic() - queued
+                LLM_QUEUE_SECONDS.observe(queue_wait)
+                llm_span.set(queue_wait=round(queue_wait, 4))
+                if stream:
+                    return await llm_router.stream_chat(build, events.token, events.session_id, model)
+                return await llm_router.post_chat(build, events.session_id, model)
+        except LLMError as e:
+            llm_span.set(outcome="error")
+            print(f"Error: {e.status}, {e.text}")
+            await events.status(f"Error: {e.status}, {e.text}")
+            return None
+
+def save_messages(session_id: str, messages: List[Message], saved: int) -> int:
+    """
+    Trim the history to the token budget in place and persist it. Only messages added since the last save
+    are appended, unless trimming changed what was already saved, in which case the history is replaced.
+    A session evicted or purged while its turn ran is stored again in full.
+    Returns the number of messages now saved.
+    """
+    fitted = context_window.fit(messages)
+    unchanged = len(fitted) >= saved and all(new is old for new, old in zip(fitted[:saved], messages[:saved]))
+    messages[:] = fitted
+    if not unchanged:
+        session_store.replace(session_id, messages)
+    elif len(messages) > saved:
+        session_store.append(session_id, messages[saved:], history=messages)
+    return len(messages)
+
+def close_pending_tool_calls(messages: List[Message], reason: str):
+    """
+    After a turn was cancelled or timed out while its tools ran, answer the unanswered tool calls so the
+    stored history stays a valid conversation for the next request.
+    """
+    last = messages[-1]
+    if isinstance(last, AIMessage) and last.tool_calls:
+        messages.extend(ToolMessage(content=reason, tool_call_id=call.get("id")) for call in last.tool_calls)
+
+async def process_chat(session_id: str, user_input: str, events: TurnEvents, stream: bool = False) -> str:
+    with span("turn", TURN_SECONDS, session_id=session_id, turn_id=events.turn_id) as turn_span:
+        # Serialize turns of the same session so they don't interleave their messages
+        async with session_locks.hold(session_id):
+            turn_span.set(lock_wait=round(turn_span.elapsed(), 4))
+            try:
+                return await process_turn(session_id, user_input, events, stream)
+            finally:
+                # Session writes are queued; the next turn, maybe in another worker, must see them
+                await session_store.flush()
+
+def answer_categories(messages: List[Message]) -> Optional[List[Optional[str]]]:
+    """
+    Categories of the tools the turn's answer was grounded on (None for a tool without one),
+    or None if a tool failed and the answer shouldn't be reused.
+    """
+    categories = []
+    for message in messages:
+        if isinstance(message, AIMessage):
+            for call in message.tool_calls:
+                tool = tool_registry.get(call.get("function", {}).get("name"))
+                categories.append(tool.category if tool else None)
+        elif isinstance(message, ToolMessage) and (not message.content or message.content.startswith("Error:")):
+            return None
+    return categories
+
+async def process_turn(session_id: str, user_input: str, events: TurnEvents, stream: bool = False) -> str:
+    messages = await session_store.aload(session_id)
+    saved = len(messages) if messages is not None else 0
+    if messages is None:
+        messages = [system_message]
+
+    # Only questions without earlier conversation mean the same thing in every session
+    cacheable = response_cache is not None and len(messages) == 1
+    if cacheable and (cached := response_cache.get(user_input)) is not None:
+        messages.extend([UserMessage(user_input), AIMessage(content=cached)])
+        save_messages(session_id, messages, saved)
+        print(f"Turn for session {session_id}: answered from the response cache")
+        current_span().set(stop_reason="cached")
+        await events.final(cached, "cached")
+        return cached
+
+    # Reject an overloaded turn before it touches the session, so a client retrying after a 429
+    # doesn't find its message (and tool results) stored twice
+    admission.check()
+    messages.append(UserMessage(user_input))
+    saved = save_messages(session_id, messages, saved)
+
+    async def send(messages, allow_tools):
+        return await send_request(messages, events, allow_tools, stream)
+
+    async def select_tools(messages):
+        return await send_request(messages, events, True, stream=False, model=small_model)
+
+    def on_messages(messages):
+        nonlocal saved
+        saved = save_messages(session_id, messages, saved)  # Update session with new messages
+
+    async def on_tool_calls(tool_calls):
+        await events.status("Processing tool calls...")
+        await events.tool_calls(tool_calls)
+
+    async def on_tool_results(tool_calls):
+        await events.tool_calls(tool_calls, state="done")
+
+    await events.status("Processing your message...")
     try:
-        message_data = llm_response.get('choices', [{}])[0].get('message', {})
-        role = message_data.get('role', 'assistant')
-        content = message_data.get('content', '')
-        tool_calls = message_data.get('tool_calls', [])
-        return AIMessage(content=content, tool_calls=tool_calls)
-    except Exception as e:
-        print(f"Error extracting LLM response: {e}")
-        return AIMessage(content="There was an error processing the response.")
-
-def add_tool_results(tool_calls):
-    tool_messages = []
-    for call in tool_calls:
-        function_name = call['function']['name']
-        tool_function = tool_functions.get(function_name)
-
-        if tool_function:
-            arguments_str = call['function']['arguments']
-            if isinstance(arguments_str, str):
-                arguments = json.loads(arguments_str)
-            else:
-                arguments = arguments_str
-
-            required_args = []
-            if function_name == "get_weather":
-                required_args = ["location"]
-            elif function_name == "lookup_wikipedia":
-                required_args = ["query"]
-            # elif function_name == "search_duckduckgo":
-            #     required_args = ["query"]
-            elif function_name == "search_searxng":
-                required_args = ["query"]
-
-            missing_args = [arg for arg in required_args if arg not in arguments or not arguments[arg]]
-            if missing_args:
-                result = f"Error: The tool call for '{function_name}' did not include the required arguments: {', '.join(missing_args)}."
-                print(result)
-            else:
-                result = tool_function(**arguments)
-                print(f"Result from {function_name}: {result}")
-
-            tool_message = ToolMessage(content=result, tool_call_id=call["id"])
-            tool_messages.append(tool_message.to_dict())
-        else:
-            print(f"No tool function found for {function_name}")
-    return tool_messages
-
-async def send_request(messages, session_id: str):
-    payload = {
-        "model": model,
-        "messages": messages,
-        "tools": tools,
-        "keep_alive": "-1"
-    }
-
-    await manager.send_personal_message("Sending request to AI model...", session_id)
-    response = requests.post(api_url, headers=headers, data=json.dumps(payload))
-
-    if response.status_code == 200:
-        return response.json()
+        # Everything the turn starts is cancelled once the deadline passes or the turn itself is cancelled
+        async with deadline(turn_deadline):
+            result = await agent_loop.run(messages, tool_selection.wrap(select_tools, send), on_messages, on_tool_calls, on_tool_results)
+    except asyncio.CancelledError:
+        close_pending_tool_calls(messages, "Cancelled by the user.")
+        save_messages(session_id, messages, saved)
+        raise
+    except TimeoutError:
+        close_pending_tool_calls(messages, "Cancelled because the request took too long.")
+        save_messages(session_id, messages, saved)
+        print(f"Turn for session {session_id} passed its {turn_deadline:g}s deadline")
+        current_span().set(stop_reason="deadline")
+        content = "Sorry, answering took too long. Please try again."
+        await events.error(content)
+        return content
+    print(f"Turn for session {session_id}: {json.dumps(result.to_dict())}")
+    current_span().set(stop_reason=result.stop_reason, tokens=result.total_tokens)
+    if result.stop_reason == "error":
+        await events.error(result.content)
     else:
-        print(f"Error: {response.status_code}, {response.text}")
-        await manager.send_personal_message(f"Error: {response.status_code}, {response.text}", session_id)
-        return None
+        if cacheable and result.stop_reason == "done":
+            categories = answer_categories(messages[2:])
+            if categories is not None:
+                response_cache.set(user_input, result.content, categories)
+        await events.final(result.content, result.stop_reason)
+    return result.content
+
+def new_turn_events(session_id: str, turn_id: Optional[str] = None,
+                    on_token: Optional[Callable[[str], Awaitable[None]]] = None) -> TurnEvents:
+    return TurnEvents(session_id, turn_id or str(uuid.uuid4()), manager.send_personal_message, on_token)
+
+async def cancel_on_disconnect(request: Request, turn: Awaitable[str], events: TurnEvents) -> Optional[str]:
+    """
+    Run a turn for an HTTP request, cancelling it as soon as the client disconnects so the LLM and
+    tools stop working on an answer nobody will receive. Returns None if the turn was cancelled.
+    """
+    task = asyncio.ensure_future(turn)
+    try:
+        while not task.done():
+            await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if not task.done() and await request.is_disconnected():
+                print(f"Client of session {events.session_id} disconnected, cancelling turn {events.turn_id}")
+                task.cancel()
+                await events.cancelled()
+                return None
+        return task.result()
+    finally:
+        task.cancel()
 
 @app.post("/chat/")
-async def chat(input: UserInput):
-    session_id = input.session_id
-    user_input = input.message
-    
-    if session_id not in session_store:
-        session_store[session_id] = [SystemMessage(SYSTEM_MESSAGE_CONTENT).to_dict()]
-    
-    messages = session_store[session_id]
-    messages.append(UserMessage(user_input).to_dict())
-    
-    await manager.send_personal_message("Processing your message...", session_id)
-    response_data = await send_request(messages, session_id)
-    
-    if response_data:
-        ai_message = extract_llm_response(response_data)
-        messages.append(ai_message.to_dict())
-        
-        tool_calls = ai_message.tool_calls
-        if tool_calls:
-            await manager.send_personal_message("Processing tool calls...", session_id)
-            tool_messages = add_tool_results(tool_calls)
-            messages.extend(tool_messages)
-            final_response_data = await send_request(messages, session_id)
-            if final_response_data:
-                final_message = extract_llm_response(final_response_data)
-                messages.append(final_message.to_dict())
-                session_store[session_id] = messages  # Update session with new messages
-                await manager.send_personal_message(final_message.content, session_id)
-                return {"response": final_message.content}
-            else:
-                return {"response": "Error during final processing."}
-        else:
-            session_store[session_id] = messages  # Update session with new messages
-            await manager.send_personal_message(ai_message.content, session_id)
-            return {"response": ai_message.content}
-    else:
-        return {"response": "Error processing the request."}
+async def chat(input: UserInput, request: Request):
+    events = new_turn_events(input.session_id)
+    try:
+        await events.start(input.message)
+        response = await cancel_on_disconnect(
+            request, process_chat(input.session_id, input.message, events, stream=stream_responses), events
+        )
+    except Overloaded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    return {"response": response}
+
+@app.post("/chat/stream")
+async def chat_stream(input: UserInput):
+    """
+    Streaming variant of /chat/ that writes tokens to the HTTP response body as they are generated.
+    """
+    # Reject up front while the status code can still be set
+    try:
+        admission.check()
+    except Overloaded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+    queue: asyncio.Queue = asyncio.Queue()
+
+    streamed = False
+
+    async def on_token(token: str):
+        nonlocal streamed
+        streamed = True
+        await queue.put(token)
+
+    async def run_turn():
+        try:
+            try:
+                events = new_turn_events(input.session_id, on_token=on_token)
+                response = await process_chat(input.session_id, input.message, events, stream=True)
+            except Overloaded as e:
+                response = f"Error: {e}. Please retry in {e.retry_after} seconds."
+            if not streamed:
+                # Nothing was generated incrementally (e.g. an error), so send the whole response
+                await queue.put(response)
+        finally:
+            await queue.put(None)
+
+    async def token_stream():
+        task = asyncio.create_task(run_turn())
+        try:
+            while (token := await queue.get()) is not None:
+                yield token
+            await task
+        finally:
+            task.cancel()
+
+    return StreamingResponse(token_stream(), media_type="text/plain; charset=utf-8")
+
+# Turns started over a WebSocket that are still running in this process, by session: (turn_id, task)
+active_turns: Dict[str, Tuple[str, asyncio.Task]] = {}
+
+def cancel_turn(session_id: str, turn_id: Optional[str] = None):
+    """
+    Cancel the session's running WebSocket turn, or only the given turn if turn_id is set.
+    """
+    running = active_turns.get(session_id)
+    if running and (turn_id is None or running[0] == turn_id):
+        running[1].cancel()
+
+async def run_socket_turn(session_id: str, turn_id: str, message: str):
+    events = new_turn_events(session_id, turn_id)
+    try:
+        await events.start(message)
+        await process_chat(session_id, message, events, stream=stream_responses)
+    except Overloaded as e:
+        await events.error(f"{e}. Please retry in {e.retry_after} seconds.")
+    except asyncio.CancelledError:
+        await events.cancelled()
+    except Exception as e:
+        print(f"Error in turn {turn_id} of session {session_id}: {e}")
+        await events.error("Error processing the request.")
+    finally:
+        if active_turns.get(session_id, (None,))[0] == turn_id:
+            del active_turns[session_id]
+
+def start_socket_turn(session_id: str, turn_id: str, message: str):
+    # A new message interrupts the turn still running for the session
+    cancel_turn(session_id)
+    active_turns[session_id] = (turn_id, asyncio.create_task(run_socket_turn(session_id, turn_id, message)))
 
 @app.websocket("/ws/{session_id}")
 async def websocket_endpoint(websocket: WebSocket, session_id: str):
-    await manager.connect(websocket, session_id)
+    connection = await manager.connect(websocket, session_id)
     try:
         while True:
-            # Keep the connection alive, we don't need to receive messages from the client
-            await websocket.receive_text()
-    except WebSocketDisconnect:
-        manager.disconnect(session_id)
+            text = await websocket.receive_text()
+            # Any message from the client (including heartbeat pongs) shows the connection is alive
+            connection.touch()
+            frame = parse_client_frame(text)
+            if frame is None or frame["type"] == "pong":
+                continue
+            if frame["type"] == "chat":
+                start_socket_turn(session_id, str(frame.get("turn_id") or uuid.uuid4()), frame["message"])
+            elif frame["type"] == "cancel":
+                cancel_turn(session_id, frame.get("turn_id"))
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        manager.disconnect(connection)
+        # Nobody in this process is left to receive the running turn's answer, so stop working on it
+        if session_id not in manager.active_connections:
+            cancel_turn(session_id)
+
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/llm/backends")
+async def get_llm_backend_stats():
+    return {**llm_router.stats(), "tool_selection": tool_selection.stats()}
+
+@app.get("/tools/cache")
+async def get_tool_cache_stats():
+    return cache_stats()
+
+@app.get("/responses/cache")
+async def get_response_cache_stats():
+    return response_cache.stats() if response_cache is not None else {"enabled": False}
 
 @app.get("/session/")
 async def get_session_id():
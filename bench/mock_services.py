@@ -0,0 +1,183 @@
+# bench/mock_services.py
+"""
+Stand-ins for every service the chat app talks to, served from one local port, so benchmarks run
+offline and always see the same latencies:
+
+    POST /v1/chat/completions   OpenAI-compatible chat completions, streamed or not
+    GET  /v1/models             model list, used by the LLM router's health checks
+    GET  /search                SearxNG JSON results pointing at /page/{n}
+    GET  /page/{n}              HTML result pages for the page fetcher
+    GET  /w/api.php             MediaWiki intro extracts
+    GET  /timeline/{location}/today   Visual Crossing weather report
+
+The mock model calls a tool when the last message is a user message that asks for one, in the
+prompt shapes run_bench.py sends ("weather in X", "who is X", "search for X"), and otherwise answers
+with a fixed number of tokens. It waits `latency` seconds before the first token (prefill) and
+produces `token_rate` tokens per second after that.
+
+    python bench/mock_services.py --port 18700 --latency 0.05 --token-rate 200
+"""
+import argparse
+import asyncio
+import json
+import re
+
+from aiohttp import web
+
+TOOL_PROMPTS = (
+    (re.compile(r"weather in (.+)", re.I), "get_weather", "location"),
+    (re.compile(r"who is (.+)", re.I), "lookup_wikipedia", "query"),
+    (re.compile(r"search for (.+)", re.I), "search_searxng", "query"),
+)
+
+PAGE_HTML = (
+    "<html><head><title>Result {n}</title><style>p {{ color: black; }}</style></head><body>"
+    "<nav><a href='/'>Home</a></nav>"
+    "<p>This is the first paragraph of result page {n}, long enough to be worth summarizing.</p>"
+    "<p>A second paragraph adds a little more text about the topic of page {n}.</p>"
+    "<p>The third paragraph completes the summary.</p>"
+    "{filler}</body></html>"
+)
+
+
+class MockServices:
+    def __init__(self, latency: float = 0.05, token_rate: float = 200.0, answer_tokens: int = 40,
+                 tool_latency: float = 0.02, page_bytes: int = 20000):
+        self.latency = latency
+        self.token_rate = token_rate
+        self.answer_tokens = answer_tokens
+        self.tool_latency = tool_latency
+        self.page_filler = "<div>" + "filler text " * (page_bytes // 12) + "</div>"
+        self.requests = {"chat": 0, "search": 0, "page": 0, "wikipedia": 0, "weather": 0}
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.chat)
+        app.router.add_get("/v1/models", self.models)
+        app.router.add_get("/search", self.search)
+        app.router.add_get("/page/{n}", self.page)
+        app.router.add_get("/w/api.php", self.wikipedia)
+        app.router.add_get("/timeline/{location}/today", self.weather)
+        app.router.add_get("/stats", self.stats)
+        return app
+
+    # LLM
+
+    @staticmethod
+    def _tool_call(body: dict):
+        messages = body.get("messages") or []
+        if not messages or messages[-1].get("role") != "user" or body.get("tool_choice") == "none":
+            return None
+        offered = {tool["function"]["name"] for tool in body.get("tools") or []}
+        for pattern, name, argument in TOOL_PROMPTS:
+            match = pattern.search(messages[-1].get("content") or "")
+            if match and name in offered:
+                value = match.group(1).strip(" ?.!")
+                return {"id": f"call_{name}", "type": "function",
+                        "function": {"name": name, "arguments": json.dumps({argument: value})}}
+        return None
+
+    def _answer_tokens(self, body: dict):
+        grounded = any(message.get("role") == "tool" for message in body.get("messages") or [])
+        prefix = "Based on the tool results" if grounded else "Here is my answer"
+        return [f"{prefix}," if i == 0 else f" word{i}" for i in range(self.answer_tokens)]
+
+    async def chat(self, request: web.Request) -> web.StreamResponse:
+        self.requests["chat"] += 1
+        raw = await request.read()
+        body = json.loads(raw)
+        usage = {"prompt_tokens": len(raw) // 4}
+        tool_call = self._tool_call(body)
+        tokens = [] if tool_call else self._answer_tokens(body)
+        usage["completion_tokens"] = 12 if tool_call else len(tokens)
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        await asyncio.sleep(self.latency)
+
+        if not body.get("stream"):
+            await asyncio.sleep(usage["completion_tokens"] / self.token_rate)
+            message = {"role": "assistant", "content": "".join(tokens)}
+            if tool_call:
+                message["tool_calls"] = [tool_call]
+            return web.json_response({
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if tool_call else "stop"}],
+                "usage": usage,
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+
+        async def send(chunk):
+            await response.write(b"data: " + json.dumps(chunk).encode() + b"\n\n")
+
+        if tool_call:
+            await asyncio.sleep(usage["completion_tokens"] / self.token_rate)
+            await send({"choices": [{"index": 0, "delta": {"role": "assistant", "tool_calls": [{"index": 0, **tool_call}]}}]})
+        else:
+            for token in tokens:
+                await send({"choices": [{"index": 0, "delta": {"content": token}}]})
+                await asyncio.sleep(1 / self.token_rate)
+        await send({"choices": [{"index": 0, "delta": {}, "finish_reason": "tool_calls" if tool_call else "stop"}],
+                    "usage": usage})
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    async def models(self, request: web.Request) -> web.Response:
+        return web.json_response({"object": "list", "data": [{"id": "mock", "object": "model"}]})
+
+    # Tools
+
+    async def search(self, request: web.Request) -> web.Response:
+        self.requests["search"] += 1
+        await asyncio.sleep(self.tool_latency)
+        query = request.query.get("q", "")
+        base = f"{request.scheme}://{request.host}"
+        return web.json_response({"query": query, "results": [
+            {"title": f"{query} result {n}", "url": f"{base}/page/{n}", "content": f"Snippet {n}"} for n in range(1, 6)
+        ]})
+
+    async def page(self, request: web.Request) -> web.Response:
+        self.requests["page"] += 1
+        await asyncio.sleep(self.tool_latency)
+        return web.Response(text=PAGE_HTML.format(n=request.match_info["n"], filler=self.page_filler),
+                            content_type="text/html")
+
+    async def wikipedia(self, request: web.Request) -> web.Response:
+        self.requests["wikipedia"] += 1
+        await asyncio.sleep(self.tool_latency)
+        titles = [title for title in request.query.get("titles", "").split("|") if title]
+        pages = [{"pageid": i, "title": title, "extract": f"{title} is the subject of this mock encyclopedia entry. " * 8}
+                 for i, title in enumerate(titles, start=1)]
+        return web.json_response({"batchcomplete": True, "query": {"pages": pages}})
+
+    async def weather(self, request: web.Request) -> web.Response:
+        self.requests["weather"] += 1
+        await asyncio.sleep(self.tool_latency)
+        return web.json_response({
+            "resolvedAddress": request.match_info["location"],
+            "days": [{
+                "datetime": "2024-01-01", "description": "Partly cloudy throughout the day.", "temp": 61.2,
+                "feelslike": 60.8, "tempmax": 66.0, "tempmin": 54.1, "precipprob": 10, "humidity": 58.3,
+                "windspeed": 9.4, "windgust": 17.2, "uvindex": 5, "sunrise": "07:12:03", "sunset": "17:41:55",
+            }],
+        })
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.requests)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve mock LLM, SearxNG, Wikipedia and weather APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18700)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds before the model's first token")
+    parser.add_argument("--token-rate", type=float, default=200.0, help="tokens per second the model generates")
+    parser.add_argument("--answer-tokens", type=int, default=40, help="tokens in each answer")
+    parser.add_argument("--tool-latency", type=float, default=0.02, help="seconds each tool API takes to answer")
+    args = parser.parse_args()
+    services = MockServices(args.latency, args.token_rate, args.answer_tokens, args.tool_latency)
+    web.run_app(services.app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+# bench/run_bench.py
+"""
+Load test of the chat app against the local mock services, runnable offline (e.g. in CI).
+
+Starts bench/mock_services.py and the app under uvicorn, opens N concurrent sessions that each send
+a series of messages over one transport, and reports per transport:
+
+    latency p50/p95/p99   time from sending a message to the complete answer
+    TTFT p50/p95/p99      time to the first answer token (ws and stream transports)
+    throughput            answered turns per second of wall time
+    RSS                   resident memory of the app process, at start and at its peak
+
+Transports:
+    http    POST /chat/ (tokens go to the session's WebSocket, so there is no TTFT)
+    stream  POST /chat/stream, answer streamed in the response body
+    ws      chat frames over /ws/{session_id}
+
+Messages alternate between plain questions and questions that make the mock model call the weather,
+Wikipedia and SearxNG tools. Every session asks about its own places and people so tool caches don't
+hide the tool path; pass --repeat-prompts to measure a warm cache instead.
+
+    python bench/run_bench.py --sessions 20 --turns 4 --transport ws --transport http
+    python bench/run_bench.py --json bench_output.json --baseline bench_baseline.json --tolerance 0.2
+
+With --baseline the run fails (exit status 1) when p95 latency or TTFT grows, or throughput drops,
+by more than --tolerance compared with the baseline report.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+import aiohttp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TRANSPORTS = ("http", "stream", "ws")
+
+PROMPTS = (
+    "Tell me something interesting about number {n}.",
+    "What's the weather in Testville {n}?",
+    "Who is Person {n}?",
+    "Search for benchmark topic {n}",
+)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_bytes(pid: int) -> Optional[int]:
+    """Resident memory of a process from /proc, or None where that isn't available."""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class TurnResult:
+    __slots__ = ("latency", "ttft", "error")
+
+    def __init__(self, latency: float, ttft: Optional[float] = None, error: Optional[str] = None):
+        self.latency = latency
+        self.ttft = ttft
+        self.error = error
+
+
+async def http_turn(client: aiohttp.ClientSession, base: str, session_id: str, message: str) -> TurnResult:
+    started = time.perf_counter()
+    async with client.post(f"{base}/chat/", json={"session_id": session_id, "message": message}) as response:
+        body = await response.read()
+        if response.status != 200:
+            return TurnResult(time.perf_counter() - started, error=f"HTTP {response.status}: {body[:200]!r}")
+    return TurnResult(time.perf_counter() - started)
+
+
+async def stream_turn(client: aiohttp.ClientSession, base: str, session_id: str, message: str) -> TurnResult:
+    started = time.perf_counter()
+    ttft = None
+    async with client.post(f"{base}/chat/stream", json={"session_id": session_id, "message": message}) as response:
+        if response.status != 200:
+            return TurnResult(time.perf_counter() - started, error=f"HTTP {response.status}")
+        async for chunk in response.content.iter_any():
+            if ttft is None and chunk:
+                ttft = time.perf_counter() - started
+    return TurnResult(time.perf_counter() - started, ttft)
+
+
+async def ws_turn(socket_: aiohttp.ClientWebSocketResponse, turn_id: str, message: str) -> TurnResult:
+    started = time.perf_counter()
+    ttft = None
+    await socket_.send_str(json.dumps({"type": "chat", "turn_id": turn_id, "message": message}))
+    async for received in socket_:
+        if received.type != aiohttp.WSMsgType.TEXT:
+            return TurnResult(time.perf_counter() - started, ttft, error=f"socket closed ({received.type.name})")
+        frame = json.loads(received.data)
+        if frame.get("type") == "ping":
+            await socket_.send_str('{"type":"pong"}')
+            continue
+        if frame.get("turn_id") != turn_id:
+            continue
+        if frame["type"] == "token" and ttft is None:
+            ttft = time.perf_counter() - started
+        elif frame["type"] == "final":
+            return TurnResult(time.perf_counter() - started, ttft)
+        elif frame["type"] in ("error", "cancelled"):
+            return TurnResult(time.perf_counter() - started, ttft, error=frame.get("content", frame["type"]))
+    return TurnResult(time.perf_counter() - started, ttft, error="socket closed")
+
+
+async def run_session(client: aiohttp.ClientSession, base: str, transport: str, index: int, turns: int,
+                      repeat_prompts: bool, rng: random.Random) -> List[TurnResult]:
+    async with client.get(f"{base}/session/") as response:
+        session_id = (await response.json())["session_id"]
+    subject = 0 if repeat_prompts else index
+    messages = [PROMPTS[(index + turn) % len(PROMPTS)].format(n=subject) for turn in range(turns)]
+    results = []
+    # Stagger session starts a little so they don't all hit the app in the same millisecond
+    await asyncio.sleep(rng.random() * 0.05)
+    if transport == "ws":
+        async with client.ws_connect(f"{base.replace('http', 'ws', 1)}/ws/{session_id}") as socket_:
+            for turn, message in enumerate(messages):
+                results.append(await ws_turn(socket_, f"s{index}t{turn}", message))
+    else:
+        send_turn = http_turn if transport == "http" else stream_turn
+        for message in messages:
+            results.append(await send_turn(client, base, session_id, message))
+    return results
+
+
+async def run_transport(base: str, transport: str, sessions: int, turns: int, repeat_prompts: bool,
+                        seed: int, app_pid: int) -> Dict:
+    rng = random.Random(seed)
+    peak_rss = rss_bytes(app_pid)
+    start_rss = peak_rss
+
+    async def sample_rss():
+        nonlocal peak_rss
+        while True:
+            await asyncio.sleep(0.1)
+            rss = rss_bytes(app_pid)
+            if rss is not None and (peak_rss is None or rss > peak_rss):
+                peak_rss = rss
+
+    sampler = asyncio.create_task(sample_rss())
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=600)
+    started = time.perf_counter()
+    try:
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as client:
+            per_session = await asyncio.gather(*(
+                run_session(client, base, transport, index, turns, repeat_prompts, rng) for index in range(sessions)
+            ), return_exceptions=True)
+    finally:
+        sampler.cancel()
+    wall = time.perf_counter() - started
+
+    results: List[TurnResult] = []
+    errors: List[str] = []
+    for outcome in per_session:
+        if isinstance(outcome, BaseException):
+            errors.append(f"session failed: {outcome!r}")
+            continue
+        results.extend(outcome)
+        errors.extend(result.error for result in outcome if result.error)
+    ok = [result for result in results if not result.error]
+    latencies = [result.latency for result in ok]
+    ttfts = [result.ttft for result in ok if result.ttft is not None]
+    return {
+        "transport": transport,
+        "sessions": sessions,
+        "turns": len(results),
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "wall_seconds": round(wall, 3),
+        "throughput": round(len(ok) / wall, 2) if wall else 0.0,
+        "latency": {f"p{p}": _ms(percentile(latencies, p)) for p in (50, 95, 99)},
+        "ttft": {f"p{p}": _ms(percentile(ttfts, p)) for p in (50, 95, 99)},
+        "rss_mb": {"start": _mb(start_rss), "peak": _mb(peak_rss)},
+    }
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def _mb(size: Optional[int]) -> Optional[float]:
+    return round(size / (1 << 20), 1) if size is not None else None
+
+
+def wait_for(url: str, process: subprocess.Popen, timeout: float = 30.0):
+    async def poll():
+        deadline = time.monotonic() + timeout
+        async with aiohttp.ClientSession() as client:
+            while time.monotonic() < deadline:
+                if process.poll() is not None:
+                    raise RuntimeError(f"{process.args} exited with status {process.returncode}")
+                try:
+                    async with client.get(url, timeout=aiohttp.ClientTimeout(total=1)) as response:
+                        if response.status == 200:
+                            return
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    pass
+                await asyncio.sleep(0.1)
+        raise RuntimeError(f"{url} did not come up within {timeout:g}s")
+
+    asyncio.run(poll())
+
+
+def start_services(args) -> List[subprocess.Popen]:
+    mock_port = free_port()
+    app_port = args.app_port or free_port()
+    mock = f"http://127.0.0.1:{mock_port}"
+    processes = [subprocess.Popen([
+        sys.executable, os.path.join(ROOT, "bench", "mock_services.py"), "--port", str(mock_port),
+        "--latency", str(args.latency), "--token-rate", str(args.token_rate),
+        "--answer-tokens", str(args.answer_tokens), "--tool-latency", str(args.tool_latency),
+    ])]
+    wait_for(f"{mock}/v1/models", processes[0])
+
+    env = dict(os.environ)
+    env.update({
+        "API_URL": f"{mock}/v1/chat/completions",
+        "API_KEY": "bench",
+        "MODEL": "mock",
+        "SEARXNG_URL": f"{mock}/search",
+        "WIKIPEDIA_API_URL": f"{mock}/w/api.php",
+        "WEATHER_API_URL": f"{mock}/timeline/",
+        "VISUAL_CROSSING_API_KEY": "bench",
+        "SESSION_BACKEND": "memory",
+        "STREAM_RESPONSES": "true",
+        "LLM_CACHE_HINTS": "",
+    })
+    for assignment in args.env:
+        key, _, value = assignment.partition("=")
+        env[key] = value
+    output = None if args.verbose else subprocess.DEVNULL
+    processes.append(subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(app_port),
+         "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=output, stderr=output,
+    ))
+    wait_for(f"http://127.0.0.1:{app_port}/session/", processes[1])
+    args.base = f"http://127.0.0.1:{app_port}"
+    return processes
+
+
+def compare(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Regressions of this report against the baseline, as readable lines."""
+    previous = {run["transport"]: run for run in baseline.get("runs", [])}
+    regressions = []
+    for run in report["runs"]:
+        old = previous.get(run["transport"])
+        if old is None:
+            continue
+        for metric in ("latency", "ttft"):
+            new_value, old_value = run[metric]["p95"], old[metric]["p95"]
+            if new_value is not None and old_value and new_value > old_value * (1 + tolerance):
+                regressions.append(f"{run['transport']}: {metric} p95 {old_value}ms -> {new_value}ms")
+        if old["throughput"] and run["throughput"] < old["throughput"] * (1 - tolerance):
+            regressions.append(f"{run['transport']}: throughput {old['throughput']}/s -> {run['throughput']}/s")
+        if run["errors"] > old["errors"]:
+            regressions.append(f"{run['transport']}: errors {old['errors']} -> {run['errors']}")
+    return regressions
+
+
+def format_report(report: Dict) -> str:
+    lines = [
+        f"{'transport':<9} {'turns':>6} {'errors':>6} {'turns/s':>8} "
+        f"{'lat p50':>8} {'p95':>8} {'p99':>8} {'ttft p50':>9} {'p95':>8} {'p99':>8} {'rss MB':>13}",
+    ]
+    for run in report["runs"]:
+        latency, ttft, rss = run["latency"], run["ttft"], run["rss_mb"]
+        lines.append(
+            f"{run['transport']:<9} {run['turns']:>6} {run['errors']:>6} {run['throughput']:>8} "
+            f"{_cell(latency['p50']):>8} {_cell(latency['p95']):>8} {_cell(latency['p99']):>8} "
+            f"{_cell(ttft['p50']):>9} {_cell(ttft['p95']):>8} {_cell(ttft['p99']):>8} "
+            f"{_cell(rss['start']) + '/' + _cell(rss['peak']):>13}"
+        )
+        lines.extend(f"    {sample}" for sample in run["error_samples"])
+    lines.append("Latencies in ms; rss is start/peak of the app process.")
+    return "\n".join(lines)
+
+
+def _cell(value) -> str:
+    return "-" if value is None else str(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the chat app against local mock services")
+    parser.add_argument("--sessions", type=int, default=20, help="concurrent sessions per transport")
+    parser.add_argument("--turns", type=int, default=4, help="messages sent by each session")
+    parser.add_argument("--transport", action="append", choices=TRANSPORTS,
+                        help="transport to drive, repeat for several (default: all)")
+    parser.add_argument("--latency", type=float, default=0.05, help="mock model seconds before the first token")
+    parser.add_argument("--token-rate", type=float, default=200.0, help="mock model tokens per second")
+    parser.add_argument("--answer-tokens", type=int, default=40, help="tokens in each mock answer")
+    parser.add_argument("--tool-latency", type=float, default=0.02, help="seconds each mock tool API takes")
+    parser.add_argument("--repeat-prompts", action="store_true", help="send the same prompts from every session")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra environment for the app, e.g. --env RESPONSE_CACHE=true")
+    parser.add_argument("--app-port", type=int, default=0, help="port for the app (default: a free port)")
+    parser.add_argument("--json", help="write the report as JSON to this file")
+    parser.add_argument("--baseline", help="JSON report of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression against the baseline")
+    parser.add_argument("--verbose", action="store_true", help="show the app's output")
+    args = parser.parse_args()
+
+    processes = start_services(args)
+    try:
+        runs = []
+        for offset, transport in enumerate(args.transport or TRANSPORTS):
+            runs.append(asyncio.run(run_transport(args.base, transport, args.sessions, args.turns,
+                                                  args.repeat_prompts, args.seed + offset, processes[1].pid)))
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    report = {
+        "config": {key: getattr(args, key) for key in
+                   ("sessions", "turns", "latency", "token_rate", "answer_tokens", "tool_latency", "repeat_prompts", "env")},
+        "runs": runs,
+    }
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+
+    failed = any(run["errors"] for run in runs)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(report, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        failed = failed or bool(regressions)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
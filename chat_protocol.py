@@ -0,0 +1,89 @@
+# chat_protocol.py
+"""
+JSON frames exchanged over /ws/{session_id}.
+
+Client -> server:
+    {"type": "chat", "turn_id": "...", "message": "..."}   start a turn (cancels the session's running turn)
+    {"type": "cancel", "turn_id": "..."}                   cancel a running turn (turn_id optional)
+    {"type": "pong"}                                       heartbeat answer
+
+Server -> client, every frame of a turn carries its turn_id:
+    {"type": "start", "message": "..."}                     the user's message, so other tabs can show it
+    {"type": "status", "content": "..."}                    progress text
+    {"type": "token", "content": "..."}                     streamed answer text
+    {"type": "tool", "state": "running"|"done", "calls": [{"id", "name"}]}
+    {"type": "final", "content": "...", "stop_reason": "..."}
+    {"type": "error", "content": "..."}
+    {"type": "cancelled"}
+"""
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import json_codec
+
+CLIENT_FRAME_TYPES = {"chat", "cancel", "pong"}
+
+
+def encode_frame(frame_type: str, turn_id: Optional[str] = None, **fields) -> str:
+    frame = {"type": frame_type}
+    if turn_id is not None:
+        frame["turn_id"] = turn_id
+    frame.update(fields)
+    return json_codec.dumps(frame).decode()
+
+
+def parse_client_frame(text: str) -> Optional[Dict]:
+    """
+    Decode a frame sent by the client, or return None if it isn't a known frame
+    (e.g. a plain-text keepalive from an older page).
+    """
+    try:
+        frame = json_codec.loads(text)
+    except json_codec.DecodeError:
+        return None
+    if not isinstance(frame, dict) or frame.get("type") not in CLIENT_FRAME_TYPES:
+        return None
+    if frame["type"] == "chat" and not (isinstance(frame.get("message"), str) and frame["message"].strip()):
+        return None
+    return frame
+
+
+class TurnEvents:
+    """
+    Reports the progress of one turn to every WebSocket of its session as frames tagged with the turn id.
+    Tokens go to on_token instead when one is given, e.g. to stream them in an HTTP response.
+    """
+
+    def __init__(self, session_id: str, turn_id: str, publish: Callable[[str, str], Awaitable[None]],
+                 on_token: Optional[Callable[[str], Awaitable[None]]] = None):
+        self.session_id = session_id
+        self.turn_id = turn_id
+        self._publish = publish
+        self._on_token = on_token
+
+    async def _send(self, frame_type: str, **fields):
+        await self._publish(encode_frame(frame_type, self.turn_id, **fields), self.session_id)
+
+    async def start(self, message: str):
+        await self._send("start", message=message)
+
+    async def status(self, content: str):
+        await self._send("status", content=content)
+
+    async def token(self, content: str):
+        if self._on_token:
+            await self._on_token(content)
+        else:
+            await self._send("token", content=content)
+
+    async def tool_calls(self, tool_calls: List[Dict], state: str = "running"):
+        calls = [{"id": call.get("id"), "name": call.get("function", {}).get("name")} for call in tool_calls]
+        await self._send("tool", state=state, calls=calls)
+
+    async def final(self, content: str, stop_reason: str):
+        await self._send("final", content=content, stop_reason=stop_reason)
+
+    async def error(self, content: str):
+        await self._send("error", content=content)
+
+    async def cancelled(self):
+        await self._send("cancelled")
@@ -0,0 +1,102 @@
+# concurrency.py
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Dict
+
+
+class Overloaded(Exception):
+    """Raised when a request can't be queued; retry_after is a hint in seconds for the client."""
+
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class SessionLocks:
+    """
+    One FIFO lock per session so turns of the same conversation run one after another.
+    Locks are created on demand and dropped once no turn holds or waits for them.
+    """
+
+    def __init__(self, max_pending: int = 4):
+        self.max_pending = max_pending
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._users: Dict[str, int] = {}
+
+    @asynccontextmanager
+    async def hold(self, session_id: str):
+        users = self._users.get(session_id, 0)
+        if users > self.max_pending:
+            raise Overloaded(f"Too many pending messages for session {session_id}")
+        lock = self._locks.setdefault(session_id, asyncio.Lock())
+        self._users[session_id] = users + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._users[session_id] -= 1
+            if not self._users[session_id]:
+                del self._users[session_id]
+                del self._locks[session_id]
+
+
+class AdmissionController:
+    """
+    Caps the number of concurrent LLM requests with a bounded wait queue.
+    When the queue is full new requests are rejected with a Retry-After estimate
+    based on how long requests have recently been taking.
+
+    A turn is admitted once, with check(), before it changes the session; the LLM requests it makes
+    afterwards take a slot with slot(reject=False) and wait for one instead of failing half-way.
+    """
+
+    def __init__(self, max_concurrent: int = 8, max_waiting: int = 32, smoothing: float = 0.2):
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.smoothing = smoothing
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.avg_duration = 1.0
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+
+    def retry_after(self) -> int:
+        # Time for the requests ahead in the queue to drain through the available slots
+        return max(1, math.ceil(self.avg_duration * (self.waiting + 1) / self.max_concurrent))
+
+    def check(self):
+        """Raise Overloaded if a new request would be rejected right now."""
+        if self.active >= self.max_concurrent and self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise Overloaded("Too many concurrent requests to the AI model", self.retry_after())
+
+    @asynccontextmanager
+    async def slot(self, reject: bool = True):
+        if reject:
+            self.check()
+
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+            duration = time.monotonic() - started
+            self.avg_duration += self.smoothing * (duration - self.avg_duration)
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "avg_duration": round(self.avg_duration, 3),
+        }
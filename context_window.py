@@ -0,0 +1,111 @@
+# context_window.py
+from typing import List
+
+import json_codec
+from messages import ROLE_SYSTEM, ROLE_TOOL, ROLE_USER, Message, SystemMessage
+
+# Marks the note that stands in for trimmed turns, so it can be merged when trimming again
+SUMMARY_PREFIX = "Summary of earlier conversation (older turns were removed to save space). The user previously asked:"
+TRUNCATED_MARKER = "... [truncated]"
+
+
+def estimate_tokens(message: Message) -> int:
+    """
+    Rough token count of a message: about four characters per token plus a small per-message overhead.
+    Good enough for budgeting without depending on the backend model's tokenizer.
+    """
+    size = len(message.content or "")
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        size += len(json_codec.dumps(tool_calls))
+    return size // 4 + 4
+
+
+class ContextWindow:
+    """
+    Keeps a conversation under a token budget before it is sent to the model.
+
+    - System messages at the start are always kept.
+    - Tool results from earlier turns are truncated, the current turn's are left intact.
+    - When over budget, the oldest whole turns (a user message and everything after it up to the next
+      user message) are dropped until the history fits a lower target, so the prefix stays stable for
+      several turns instead of shifting every turn. The dropped user questions are kept in a short note.
+    """
+
+    def __init__(self, max_tokens: int = 8000, target_ratio: float = 0.75, tool_result_chars: int = 1500,
+                 summary_questions: int = 10, summary_question_chars: int = 200):
+        self.max_tokens = max_tokens
+        self.target_tokens = int(max_tokens * target_ratio)
+        self.tool_result_chars = tool_result_chars
+        self.summary_questions = summary_questions
+        self.summary_question_chars = summary_question_chars
+
+    def fit(self, messages: List[Message]) -> List[Message]:
+        """
+        Return the messages to keep, trimmed to the budget. The input list is not modified,
+        and messages that are kept unchanged are returned as the same objects.
+        """
+        prefix_end = 0
+        while prefix_end < len(messages) and messages[prefix_end].role == ROLE_SYSTEM:
+            prefix_end += 1
+        prefix = list(messages[:prefix_end])
+        turns = self._split_turns(messages[prefix_end:])
+
+        # Pull out an existing summary note so it can be extended with newly dropped questions
+        summarized = []
+        note = None
+        if prefix and (prefix[-1].content or "").startswith(SUMMARY_PREFIX):
+            note = prefix.pop()
+            summarized = [line[2:] for line in note.content.splitlines()[1:] if line.startswith("- ")]
+
+        turns = [self._truncate_tool_results(turn) for turn in turns[:-1]] + turns[-1:]
+
+        total = sum(estimate_tokens(message) for message in prefix) + sum(self._turn_tokens(turn) for turn in turns)
+        if total + self._note_tokens(note) > self.max_tokens:
+            while len(turns) > 1 and total + self._note_tokens(note) > self.target_tokens:
+                dropped = turns.pop(0)
+                total -= self._turn_tokens(dropped)
+                question = dropped[0].content if dropped[0].role == ROLE_USER else None
+                if question:
+                    summarized.append(" ".join(question.split())[:self.summary_question_chars])
+                    note = self._summary_note(summarized)
+            if total + self._note_tokens(note) > self.max_tokens and turns:
+                # A single turn is still too large, so truncate its tool results as well
+                turns[-1] = self._truncate_tool_results(turns[-1])
+
+        if note:
+            prefix.append(note)
+        return prefix + [message for turn in turns for message in turn]
+
+    def _summary_note(self, summarized: List[str]):
+        if not summarized:
+            return None
+        lines = [SUMMARY_PREFIX] + [f"- {question}" for question in summarized[-self.summary_questions:]]
+        return SystemMessage("\n".join(lines))
+
+    @staticmethod
+    def _note_tokens(note) -> int:
+        return estimate_tokens(note) if note else 0
+
+    @staticmethod
+    def _split_turns(messages: List[Message]) -> List[List[Message]]:
+        turns = []
+        for message in messages:
+            if message.role == ROLE_USER or not turns:
+                turns.append([])
+            turns[-1].append(message)
+        return turns
+
+    @staticmethod
+    def _turn_tokens(turn: List[Message]) -> int:
+        return sum(estimate_tokens(message) for message in turn)
+
+    def _truncate_tool_results(self, turn: List[Message]) -> List[Message]:
+        limit = self.tool_result_chars
+        return [
+            message.with_content(message.content[:limit] + TRUNCATED_MARKER)
+            if message.role == ROLE_TOOL and isinstance(message.content, str)
+            and len(message.content) > limit + len(TRUNCATED_MARKER)
+            else message
+            for message in turn
+        ]
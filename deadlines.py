@@ -0,0 +1,46 @@
+# deadlines.py
+import asyncio
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+# Event loop time by which the current turn must finish. Tasks started inside a turn inherit it,
+# so LLM requests, tools and page fetches can size their own timeouts to the time that is left.
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+def time_left() -> Optional[float]:
+    """Seconds until the current deadline (never negative), or None when there is no deadline."""
+    at = _deadline.get()
+    if at is None:
+        return None
+    return max(0.0, at - asyncio.get_running_loop().time())
+
+
+def cap(timeout: Optional[float]) -> Optional[float]:
+    """The smaller of timeout and the time left before the current deadline; None if neither is set."""
+    left = time_left()
+    if left is None:
+        return timeout
+    return left if timeout is None else min(timeout, left)
+
+
+@asynccontextmanager
+async def deadline(seconds: Optional[float]):
+    """
+    Run the block with a deadline `seconds` from now, or the enclosing deadline if that is sooner.
+    When it passes, the block is cancelled (including the requests it is waiting on) and TimeoutError is raised.
+    """
+    if not seconds:
+        yield
+        return
+    at = asyncio.get_running_loop().time() + seconds
+    enclosing = _deadline.get()
+    if enclosing is not None:
+        at = min(at, enclosing)
+    token = _deadline.set(at)
+    try:
+        async with asyncio.timeout_at(at):
+            yield
+    finally:
+        _deadline.reset(token)
@@ -0,0 +1,50 @@
+# http_pool.py
+import asyncio
+import os
+import weakref
+from typing import Optional
+
+import aiohttp
+
+from deadlines import cap
+
+# Seconds a tool's outbound request may take unless it asks for something else
+HTTP_TIMEOUT = float(os.getenv("TOOL_HTTP_TIMEOUT", "15"))
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3"
+
+# One pooled session per event loop, shared by every tool making outbound HTTP requests
+_sessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]" = weakref.WeakKeyDictionary()
+
+
+def get_session() -> aiohttp.ClientSession:
+    """
+    Return the shared keep-alive session for the running event loop, creating it on first use.
+    """
+    loop = asyncio.get_running_loop()
+    session: Optional[aiohttp.ClientSession] = _sessions.get(loop)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=int(os.getenv("TOOL_HTTP_POOL_LIMIT", "100")),
+            limit_per_host=int(os.getenv("TOOL_HTTP_POOL_LIMIT_PER_HOST", "10")),
+            ttl_dns_cache=300,
+        )
+        session = aiohttp.ClientSession(connector=connector, headers={"User-Agent": USER_AGENT})
+        _sessions[loop] = session
+    return session
+
+
+def request_timeout(total: float = HTTP_TIMEOUT) -> aiohttp.ClientTimeout:
+    """
+    Timeout for one outbound request, shortened to the time left before the current turn's deadline.
+    """
+    return aiohttp.ClientTimeout(total=cap(total))
+
+
+async def close_session():
+    """
+    Close the shared session of the running event loop, if one was created.
+    """
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
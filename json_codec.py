@@ -0,0 +1,45 @@
+# json_codec.py
+"""
+JSON encoding and decoding for LLM payloads, responses, tool arguments and stored sessions.
+
+Uses orjson or msgspec when one of them is installed, and falls back to the standard library.
+dumps always returns compact UTF-8 bytes and loads accepts bytes or str, whichever backend is active.
+"""
+import json
+
+try:
+    import orjson
+
+    BACKEND = "orjson"
+    DecodeError = (ValueError,)
+
+    def dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+
+    def loads(data):
+        return orjson.loads(data)
+
+except ImportError:
+    try:
+        import msgspec
+
+        BACKEND = "msgspec"
+        DecodeError = (ValueError, msgspec.DecodeError)
+        _encoder = msgspec.json.Encoder()
+        _decoder = msgspec.json.Decoder()
+
+        def dumps(obj) -> bytes:
+            return _encoder.encode(obj)
+
+        def loads(data):
+            return _decoder.decode(data)
+
+    except ImportError:
+        BACKEND = "json"
+        DecodeError = (ValueError,)
+
+        def dumps(obj) -> bytes:
+            return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+        def loads(data):
+            return json.loads(data)
@@ -0,0 +1,250 @@
+# llm_client.py
+import asyncio
+import random
+from typing import AsyncIterator, Awaitable, Callable, Optional, Union
+
+import aiohttp
+
+import json_codec
+from deadlines import cap, time_left
+
+# Status codes worth retrying: rate limiting and transient upstream failures
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+# Failures of a request rather than answers from the backend: a dropped connection or truncated body,
+# a timeout, or a 200 response that isn't valid JSON
+REQUEST_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError) + json_codec.DecodeError
+
+# Request fields that turn on streaming, with token usage reported in the last chunk
+STREAM_FIELDS = {"stream": True, "stream_options": {"include_usage": True}}
+
+
+class LLMError(Exception):
+    """Raised when the LLM endpoint returns a non-retryable error or retries are exhausted."""
+
+    def __init__(self, status: Optional[int], text: str):
+        super().__init__(f"{status}, {text}")
+        self.status = status
+        self.text = text
+
+
+class StreamAccumulator:
+    """
+    Merges streamed chat completion chunks back into a single assistant message.
+    Tool calls arrive as incremental deltas keyed by index, with the function arguments split across chunks.
+    """
+
+    def __init__(self):
+        self.role = "assistant"
+        self.content_parts = []
+        self.tool_calls = {}
+        self.finish_reason = None
+        self.usage = None
+
+    def add(self, chunk: dict) -> str:
+        """
+        Merge one chunk and return any content text it carried.
+        """
+        if chunk.get("usage"):
+            self.usage = chunk["usage"]
+        choices = chunk.get("choices") or []
+        if not choices:
+            return ""
+        choice = choices[0]
+        if choice.get("finish_reason"):
+            self.finish_reason = choice["finish_reason"]
+        delta = choice.get("delta") or {}
+        if delta.get("role"):
+            self.role = delta["role"]
+        for call_delta in delta.get("tool_calls") or []:
+            index = call_delta.get("index", len(self.tool_calls))
+            call = self.tool_calls.setdefault(index, {"id": None, "type": "function", "function": {"name": "", "arguments": ""}})
+            if call_delta.get("id"):
+                call["id"] = call_delta["id"]
+            if call_delta.get("type"):
+                call["type"] = call_delta["type"]
+            function_delta = call_delta.get("function") or {}
+            if function_delta.get("name"):
+                call["function"]["name"] += function_delta["name"]
+            if function_delta.get("arguments"):
+                call["function"]["arguments"] += function_delta["arguments"]
+        text = delta.get("content") or ""
+        if text:
+            self.content_parts.append(text)
+        return text
+
+    def to_response(self) -> dict:
+        """
+        Build a response in the same shape as a non-streamed chat completion.
+        """
+        message = {"role": self.role, "content": "".join(self.content_parts)}
+        if self.tool_calls:
+            message["tool_calls"] = [self.tool_calls[index] for index in sorted(self.tool_calls)]
+        response = {"choices": [{"message": message, "finish_reason": self.finish_reason}]}
+        if self.usage:
+            response["usage"] = self.usage
+        return response
+
+
+class LLMClient:
+    """
+    Shared async client for an OpenAI-compatible chat completions endpoint.
+
+    A single aiohttp session with a keep-alive connection pool is reused for every request,
+    so concurrent conversations don't block the event loop or pay a new TCP handshake per call.
+    """
+
+    def __init__(self, api_url: str, headers: dict, pool_limit: int = 100, pool_limit_per_host: int = 0,
+                 keepalive_timeout: float = 60.0, connect_timeout: float = 10.0, total_timeout: float = 300.0,
+                 max_retries: int = 2, backoff_base: float = 0.5, backoff_max: float = 8.0):
+        self.api_url = api_url
+        self.headers = headers
+        self.pool_limit = pool_limit
+        self.pool_limit_per_host = pool_limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = aiohttp.ClientTimeout(total=total_timeout, sock_connect=connect_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Created lazily so the session is bound to the running event loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_limit,
+                limit_per_host=self.pool_limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout, headers=self.headers)
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def check_health(self, url: str, timeout: float = 5.0) -> bool:
+        """
+        Probe the backend with a GET request (e.g. its /models endpoint). True if it answered with 200.
+        """
+        try:
+            async with self._get_session().get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                return response.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return False
+
+    def _request_timeout(self) -> aiohttp.ClientTimeout:
+        # Never wait on the backend past the deadline of the turn the request belongs to
+        return aiohttp.ClientTimeout(total=cap(self.timeout.total), sock_connect=self.timeout.sock_connect)
+
+    @staticmethod
+    def _check_retry_budget(delay: float, error: LLMError):
+        # A retry that can't start before the turn's deadline would only waste backend time
+        left = time_left()
+        if left is not None and delay >= left:
+            raise error
+
+    def _backoff(self, attempt: int) -> float:
+        # Exponential backoff with full jitter
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def post_chat(self, payload: Union[dict, bytes]) -> dict:
+        """
+        Send a chat completion request and return the decoded JSON response.
+        The payload is a dict or an already serialized request body.
+        Retries connection errors, broken or undecodable bodies, timeouts and retryable status codes
+        with exponential backoff.
+        """
+        session = self._get_session()
+        body = payload if isinstance(payload, bytes) else json_codec.dumps(payload)
+        attempt = 0
+        while True:
+            try:
+                async with session.post(self.api_url, data=body, timeout=self._request_timeout()) as response:
+                    if response.status == 200:
+                        return json_codec.loads(await response.read())
+                    text = await response.text()
+                    error = LLMError(response.status, text)
+                    if response.status not in RETRYABLE_STATUS or attempt >= self.max_retries:
+                        raise error
+                    retry_after = response.headers.get("Retry-After")
+                    delay = float(retry_after) if retry_after and retry_after.isdigit() else self._backoff(attempt)
+            except REQUEST_ERRORS as e:
+                error = LLMError(None, str(e) or type(e).__name__)
+                if attempt >= self.max_retries:
+                    raise error from e
+                delay = self._backoff(attempt)
+            self._check_retry_budget(delay, error)
+            attempt += 1
+            print(f"Retrying LLM request in {delay:.2f}s (attempt {attempt} of {self.max_retries})")
+            await asyncio.sleep(delay)
+
+    async def iter_chunks(self, payload: Union[dict, bytes]) -> AsyncIterator[dict]:
+        """
+        Send a streaming chat completion request and yield each decoded server-sent event chunk as it arrives.
+        A serialized payload must already include STREAM_FIELDS.
+        Retries are only attempted before the first chunk has been received.
+        """
+        session = self._get_session()
+        body = payload if isinstance(payload, bytes) else json_codec.dumps({**payload, **STREAM_FIELDS})
+        attempt = 0
+        started = False
+        while True:
+            try:
+                async with session.post(self.api_url, data=body, timeout=self._request_timeout()) as response:
+                    if response.status == 200:
+                        async for chunk in _iter_sse(response):
+                            started = True
+                            yield chunk
+                        return
+                    text = await response.text()
+                    error = LLMError(response.status, text)
+                    if response.status not in RETRYABLE_STATUS or attempt >= self.max_retries:
+                        raise error
+                    retry_after = response.headers.get("Retry-After")
+                    delay = float(retry_after) if retry_after and retry_after.isdigit() else self._backoff(attempt)
+            except REQUEST_ERRORS as e:
+                # Tokens already forwarded can't be taken back, so never retry a broken stream
+                error = LLMError(None, str(e) or type(e).__name__)
+                if started or attempt >= self.max_retries:
+                    raise error from e
+                delay = self._backoff(attempt)
+            self._check_retry_budget(delay, error)
+            attempt += 1
+            print(f"Retrying LLM request in {delay:.2f}s (attempt {attempt} of {self.max_retries})")
+            await asyncio.sleep(delay)
+
+    async def stream_chat(self, payload: Union[dict, bytes], on_token: Callable[[str], Awaitable[None]]) -> dict:
+        """
+        Stream a chat completion, awaiting on_token for every content delta,
+        and return the assembled response in the same shape as post_chat.
+        """
+        accumulator = StreamAccumulator()
+        async for chunk in self.iter_chunks(payload):
+            text = accumulator.add(chunk)
+            if text:
+                await on_token(text)
+        return accumulator.to_response()
+
+
+async def _iter_sse(response: aiohttp.ClientResponse) -> AsyncIterator[dict]:
+    """
+    Parse a text/event-stream body incrementally, yielding the JSON payload of each data event.
+    """
+    data_lines = []
+    async for raw_line in response.content:
+        line = raw_line.rstrip(b"\r\n")
+        if line.startswith(b"data:"):
+            data_lines.append(line[5:].lstrip())
+            continue
+        if line or not data_lines:
+            # Ignore comments, event names and ids; a blank line ends the event
+            continue
+        data = b"\n".join(data_lines)
+        data_lines = []
+        if data == b"[DONE]":
+            return
+        yield json_codec.loads(data)
+    if data_lines and data_lines != [b"[DONE]"]:
+        yield json_codec.loads(b"\n".join(data_lines))
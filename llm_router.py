@@ -0,0 +1,326 @@
+# llm_router.py
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Union
+from urllib.parse import urlsplit
+
+from llm_client import LLMClient, LLMError, RETRYABLE_STATUS, StreamAccumulator
+from telemetry import current_span, metrics, span
+from tool_cache import LRUCache, MISSING
+
+# Circuit breaker states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+ROUTING_STRATEGIES = {"least_outstanding", "latency"}
+
+LLM_REQUEST_SECONDS = metrics.histogram(
+    "llm_request_seconds", "Duration of chat completion requests per backend", ("model", "backend", "outcome"))
+LLM_TTFT_SECONDS = metrics.histogram(
+    "llm_time_to_first_token_seconds", "Time until the first streamed token arrived", ("model", "backend"))
+LLM_TOKENS = metrics.counter("llm_tokens_total", "Tokens reported in the usage of LLM responses", ("model", "kind"))
+
+
+class Backend:
+    """
+    One OpenAI-compatible endpoint with its own connection pool, the model it serves and its health.
+
+    Every request outcome feeds a circuit breaker: after failure_threshold consecutive failures the backend
+    is taken out of rotation for open_seconds, then a single trial request (or a successful health check)
+    decides whether it comes back.
+    """
+
+    def __init__(self, name: str, client: LLMClient, model: str, failure_threshold: int = 3,
+                 open_seconds: float = 30.0, smoothing: float = 0.2):
+        self.name = name
+        self.client = client
+        self.model = model
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.smoothing = smoothing
+        self.outstanding = 0
+        self.avg_latency: Optional[float] = None
+        self.failures = 0
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.requests = 0
+        self.errors = 0
+        self._trial_running = False
+
+    @property
+    def health_url(self) -> str:
+        # OpenAI-compatible servers list their models next to the chat completions endpoint
+        url = self.client.api_url
+        return url[: -len("/chat/completions")] + "/models" if url.endswith("/chat/completions") else url
+
+    def available(self) -> bool:
+        """Whether a request may be sent now; moves an open circuit to half-open once it has cooled down."""
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.open_seconds:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            return not self._trial_running
+        return self.state == CLOSED
+
+    def acquire(self):
+        self.outstanding += 1
+        self.requests += 1
+        if self.state == HALF_OPEN:
+            self._trial_running = True
+
+    def release(self):
+        self.outstanding -= 1
+        self._trial_running = False
+
+    def record_success(self, seconds: Optional[float] = None):
+        if seconds is not None:
+            self.avg_latency = seconds if self.avg_latency is None else (
+                (1 - self.smoothing) * self.avg_latency + self.smoothing * seconds
+            )
+        if self.state != CLOSED:
+            print(f"LLM backend {self.name} is healthy again")
+        self.failures = 0
+        self.state = CLOSED
+
+    def record_failure(self):
+        self.errors += 1
+        self.failures += 1
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+            print(f"LLM backend {self.name} failed {self.failures} times in a row, taking it out of rotation")
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict:
+        return {
+            "model": self.model,
+            "state": self.state,
+            "outstanding": self.outstanding,
+            "avg_latency": round(self.avg_latency, 3) if self.avg_latency is not None else None,
+            "requests": self.requests,
+            "errors": self.errors,
+        }
+
+
+class LLMRouter:
+    """
+    Spreads chat completion requests over several backends.
+
+    strategy picks among the available backends:
+        least_outstanding: the one with the fewest requests in flight, then the lowest average latency
+        latency:           the lowest average latency weighted by requests in flight
+    A session sticks to the backend that served it, so the backend can reuse the KV cache of the
+    conversation, unless that backend is out of rotation or has affinity_slack more requests in flight
+    than the least loaded one. A request that fails with a connection error, timeout, 429 or 5xx is
+    retried once on each other available backend. If every circuit is open the least recently opened
+    backend is tried anyway rather than failing the request without trying.
+
+    Requests are built per backend by a callback, since backends may serve different models. A request
+    for a specific model goes to the backends serving it, or to any backend if none is configured for it
+    (e.g. a second model loaded on the same Ollama server).
+    """
+
+    def __init__(self, backends: List[Backend], strategy: str = "least_outstanding", affinity_slack: int = 4,
+                 affinity_ttl: float = 3600.0, affinity_maxsize: int = 10000, health_interval: float = 10.0):
+        if not backends:
+            raise ValueError("At least one LLM backend is required")
+        if strategy not in ROUTING_STRATEGIES:
+            raise ValueError(f"Unknown LLM routing strategy: {strategy}")
+        self.backends = backends
+        self.strategy = strategy
+        self.affinity_slack = affinity_slack
+        self.affinity_ttl = affinity_ttl
+        self.health_interval = health_interval
+        self._affinity = LRUCache(maxsize=affinity_maxsize)
+        self._health_task: Optional[asyncio.Task] = None
+
+    @property
+    def models(self) -> List[str]:
+        return list(dict.fromkeys(backend.model for backend in self.backends))
+
+    async def start(self):
+        if self.health_interval and len(self.backends) > 1:
+            self._health_task = asyncio.create_task(self._run_health_checks())
+
+    async def close(self):
+        if self._health_task:
+            self._health_task.cancel()
+        for backend in self.backends:
+            await backend.client.close()
+
+    def _load(self, backend: Backend) -> tuple:
+        latency = backend.avg_latency or 0.0
+        if self.strategy == "latency":
+            return (latency * (backend.outstanding + 1), backend.outstanding)
+        return (backend.outstanding, latency)
+
+    def _candidates(self, session_id: Optional[str], exclude=(), model: Optional[str] = None) -> List[Backend]:
+        """Backends to try in order of preference."""
+        pool = [backend for backend in self.backends if backend.model == model] or self.backends
+        available = [backend for backend in pool if backend not in exclude and backend.available()]
+        if not available:
+            # Every circuit is open: try the backend that was taken out of rotation first
+            remaining = [backend for backend in pool if backend not in exclude]
+            return sorted(remaining, key=lambda backend: backend.opened_at)[:1]
+        ordered = sorted(available, key=self._load)
+        if session_id:
+            name = self._affinity.get((session_id, model))
+            sticky = next((backend for backend in ordered if backend.name == name), None) if name is not MISSING else None
+            if sticky is not None and sticky.outstanding - ordered[0].outstanding <= self.affinity_slack:
+                ordered.remove(sticky)
+                ordered.insert(0, sticky)
+        return ordered
+
+    async def _route(self, build: Callable[[Backend], Union[dict, bytes]], session_id: Optional[str],
+                     send: Callable[[Backend, Union[dict, bytes]], Awaitable[dict]],
+                     can_fail_over: Callable[[], bool] = lambda: True, model: Optional[str] = None) -> dict:
+        tried = []
+        while True:
+            candidates = self._candidates(session_id, tried, model)
+            if not candidates:
+                raise error
+            backend = candidates[0]
+            tried.append(backend)
+            backend.acquire()
+            started = time.monotonic()
+            with span("llm.request", LLM_REQUEST_SECONDS, model=model or backend.model, backend=backend.name) as request:
+                try:
+                    response = await send(backend, build(backend))
+                except LLMError as e:
+                    error = e
+                    request.set(outcome="error", status=e.status)
+                    # 4xx other than 408/429 would fail the same way anywhere; they also say nothing about health
+                    if e.status is None or e.status >= 500:
+                        backend.record_failure()
+                    if (e.status is not None and e.status not in RETRYABLE_STATUS) or not can_fail_over():
+                        raise
+                    print(f"LLM backend {backend.name} failed ({e}), trying another backend")
+                    continue
+                finally:
+                    backend.release()
+                usage = response.get("usage") or {}
+                request.set(prompt_tokens=usage.get("prompt_tokens"), completion_tokens=usage.get("completion_tokens"))
+                for kind in ("prompt", "completion"):
+                    if usage.get(f"{kind}_tokens"):
+                        LLM_TOKENS.inc(usage[f"{kind}_tokens"], model=request.attributes["model"], kind=kind)
+            backend.record_success(time.monotonic() - started)
+            if session_id:
+                self._affinity.set((session_id, model), backend.name, self.affinity_ttl)
+            return response
+
+    async def post_chat(self, build: Callable[[Backend], Union[dict, bytes]], session_id: Optional[str] = None,
+                        model: Optional[str] = None) -> dict:
+        """
+        Send a chat completion request to the best backend (for model, if given) and return the decoded
+        JSON response. build(backend) returns the request payload for that backend.
+        """
+        return await self._route(build, session_id, lambda backend, payload: backend.client.post_chat(payload),
+                                 model=model)
+
+    async def stream_chat(self, build: Callable[[Backend], Union[dict, bytes]],
+                          on_token: Callable[[str], Awaitable[None]], session_id: Optional[str] = None,
+                          model: Optional[str] = None) -> dict:
+        """
+        Stream a chat completion from the best backend, awaiting on_token for every content delta.
+        Once tokens have been forwarded the request is no longer moved to another backend.
+        """
+        streamed = False
+
+        async def send(backend, payload):
+            nonlocal streamed
+            accumulator = StreamAccumulator()
+            request = current_span()
+            async for chunk in backend.client.iter_chunks(payload):
+                text = accumulator.add(chunk)
+                if text:
+                    if not streamed:
+                        ttft = request.elapsed()
+                        request.set(ttft=round(ttft, 4))
+                        LLM_TTFT_SECONDS.observe(ttft, model=request.attributes["model"], backend=backend.name)
+                    streamed = True
+                    await on_token(text)
+            return accumulator.to_response()
+
+        return await self._route(build, session_id, send, lambda: not streamed, model)
+
+    async def _run_health_checks(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await asyncio.gather(*(self._check(backend) for backend in self.backends))
+
+    async def _check(self, backend: Backend):
+        # Idle backends are probed so a dead one is noticed before a user's request hits it,
+        # and an open circuit closes as soon as its backend answers again
+        if backend.outstanding and backend.state == CLOSED:
+            return
+        if await backend.client.check_health(backend.health_url):
+            if backend.state != CLOSED:
+                backend.record_success()
+        elif backend.state != OPEN:
+            backend.record_failure()
+
+    def stats(self) -> Dict:
+        return {
+            "strategy": self.strategy,
+            "sessions": len(self._affinity),
+            "backends": {backend.name: backend.stats() for backend in self.backends},
+        }
+
+
+def parse_backends(spec: str) -> List[Dict]:
+    """
+    Parse LLM_BACKENDS: comma-separated entries of `url`, `url|model` or `url|model|api_key`.
+    """
+    entries = []
+    for entry in spec.split(","):
+        fields = [field.strip() for field in entry.strip().split("|")]
+        if not fields[0]:
+            continue
+        fields += [""] * (3 - len(fields))
+        entries.append({"url": fields[0], "model": fields[1] or None, "api_key": fields[2] or None})
+    return entries
+
+
+def create_llm_router(default_url: str, default_model: str, default_api_key: str) -> LLMRouter:
+    """
+    Build the router from LLM_BACKENDS, or a single backend for default_url when it isn't set.
+    Backends without their own model or API key use the defaults. The LLM_* pool settings apply to each backend.
+    """
+    specs = parse_backends(os.getenv("LLM_BACKENDS", "")) or [{"url": default_url, "model": None, "api_key": None}]
+    # With several backends a failing request moves on to the next backend instead of retrying the same one
+    max_retries = int(os.getenv("LLM_MAX_RETRIES", "2")) if len(specs) == 1 else 0
+    backends = []
+    for spec in specs:
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {spec['api_key'] or default_api_key}",
+        }
+        client = LLMClient(
+            spec["url"],
+            headers,
+            pool_limit=int(os.getenv("LLM_POOL_LIMIT", "100")),
+            pool_limit_per_host=int(os.getenv("LLM_POOL_LIMIT_PER_HOST", "0")),
+            keepalive_timeout=float(os.getenv("LLM_KEEPALIVE_TIMEOUT", "60")),
+            connect_timeout=float(os.getenv("LLM_CONNECT_TIMEOUT", "10")),
+            total_timeout=float(os.getenv("LLM_TIMEOUT", "300")),
+            max_retries=max_retries,
+            backoff_base=float(os.getenv("LLM_BACKOFF_BASE", "0.5")),
+        )
+        url = urlsplit(spec["url"])
+        name = url.netloc or spec["url"]
+        if any(backend.name == name for backend in backends):
+            name = f"{name}{url.path}"
+        backends.append(Backend(
+            name,
+            client,
+            spec["model"] or default_model,
+            failure_threshold=int(os.getenv("LLM_FAILURE_THRESHOLD", "3")),
+            open_seconds=float(os.getenv("LLM_CIRCUIT_OPEN_SECONDS", "30")),
+        ))
+    return LLMRouter(
+        backends,
+        strategy=os.getenv("LLM_ROUTING", "least_outstanding").lower(),
+        affinity_slack=int(os.getenv("LLM_AFFINITY_SLACK", "4")),
+        affinity_ttl=float(os.getenv("SESSION_TTL", "86400")) or 86400.0,
+        health_interval=float(os.getenv("LLM_HEALTH_INTERVAL", "10")),
+    )
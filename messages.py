@@ -1,9 +1,53 @@
 # messages.py
+import sys
+from json_codec import dumps
+
+# Role names are interned once and shared by every message as class attributes
+ROLE_SYSTEM = sys.intern("system")
+ROLE_USER = sys.intern("user")
+ROLE_ASSISTANT = sys.intern("assistant")
+ROLE_TOOL = sys.intern("tool")
+
 
 class Message:
-    def __init__(self, role, content):
-        self.role = role
-        self.content = content
+    """
+    Base class for immutable chat messages.
+
+    Messages use __slots__ and keep their role on the class, so a stored message costs one small
+    object holding only its content. They are converted to the wire format only when sent.
+    """
+    __slots__ = ("content",)
+    role = None
+
+    def __init__(self, content):
+        object.__setattr__(self, "content", content)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def _slots(self):
+        return [slot for cls in type(self).__mro__ for slot in getattr(cls, "__slots__", ())]
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(getattr(self, slot) == getattr(other, slot) for slot in self._slots())
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+    def with_content(self, content):
+        """
+        Return a copy of the message with different content.
+        """
+        copy = object.__new__(type(self))
+        for slot in self._slots():
+            object.__setattr__(copy, slot, getattr(self, slot))
+        object.__setattr__(copy, "content", content)
+        return copy
 
     def to_dict(self):
         """
@@ -14,16 +58,27 @@ class Message:
             "content": self.content
         }
 
+    def to_json(self):
+        """
+        Encode the message as JSON bytes without building an intermediate dictionary.
+        """
+        return self._json_head + dumps(self.content) + b'}'
+
 
 class UserMessage(Message):
-    def __init__(self, content):
-        super().__init__(role="user", content=content)
+    __slots__ = ()
+    role = ROLE_USER
+    _json_head = b'{"role":"user","content":'
 
 
 class AIMessage(Message):
+    __slots__ = ("tool_calls",)
+    role = ROLE_ASSISTANT
+    _json_head = b'{"role":"assistant","content":'
+
     def __init__(self, content="", tool_calls=None):
-        super().__init__(role="assistant", content=content)
-        self.tool_calls = tool_calls or []
+        super().__init__(content=content)
+        object.__setattr__(self, "tool_calls", tuple(tool_calls) if tool_calls else ())
 
     def to_dict(self):
         """
@@ -31,19 +86,33 @@ class AIMessage(Message):
         """
         message_dict = super().to_dict()
         if self.tool_calls:
-            message_dict["tool_calls"] = self.tool_calls
+            message_dict["tool_calls"] = list(self.tool_calls)
         return message_dict
 
+    def to_json(self):
+        """
+        Encode the AI message as JSON bytes, including tool calls if present.
+        """
+        encoded = super().to_json()
+        if self.tool_calls:
+            encoded = encoded[:-1] + b',"tool_calls":' + dumps(self.tool_calls) + b'}'
+        return encoded
+
 
 class SystemMessage(Message):
-    def __init__(self, content):
-        super().__init__(role="system", content=content)
+    __slots__ = ()
+    role = ROLE_SYSTEM
+    _json_head = b'{"role":"system","content":'
 
 
 class ToolMessage(Message):
+    __slots__ = ("tool_call_id",)
+    role = ROLE_TOOL
+    _json_head = b'{"role":"tool","content":'
+
     def __init__(self, content, tool_call_id):
-        super().__init__(role="tool", content=content)
-        self.tool_call_id = tool_call_id
+        super().__init__(content=content)
+        object.__setattr__(self, "tool_call_id", tool_call_id)
 
     def to_dict(self):
         """
@@ -52,3 +121,26 @@ class ToolMessage(Message):
         message_dict = super().to_dict()
         message_dict["tool_call_id"] = self.tool_call_id
         return message_dict
+
+    def to_json(self):
+        """
+        Encode the tool message as JSON bytes, including the tool call ID.
+        """
+        return super().to_json()[:-1] + b',"tool_call_id":' + dumps(self.tool_call_id) + b'}'
+
+
+def message_from_dict(data):
+    """
+    Build a message object from its dictionary (wire) format.
+    """
+    role = data.get("role")
+    content = data.get("content")
+    if role == ROLE_USER:
+        return UserMessage(content)
+    if role == ROLE_ASSISTANT:
+        return AIMessage(content=content, tool_calls=data.get("tool_calls"))
+    if role == ROLE_SYSTEM:
+        return SystemMessage(content)
+    if role == ROLE_TOOL:
+        return ToolMessage(content, data.get("tool_call_id"))
+    raise ValueError(f"Unknown message role: {role}")
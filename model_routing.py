@@ -0,0 +1,102 @@
+# model_routing.py
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from agent_loop import ToolRunner, extract_llm_response
+from messages import Message
+
+# Which steps of a turn let the small model pick the tools
+TOOL_SELECTION_POLICIES = {"off", "first_step", "tool_steps"}
+
+
+def _total_tokens(usage: Dict) -> int:
+    return usage.get("total_tokens") or (usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0))
+
+
+class ToolSelectionRouter:
+    """
+    Lets a small, fast model make the tool-selection decisions of a turn so the large model mostly
+    writes answers.
+
+    policy:
+        off:        every request goes to the large model
+        first_step: the small model picks the tools of the turn's first step
+        tool_steps: the small model picks the tools of every step that may call tools
+
+    The small model's response is only used when it calls tools and every call passes validation
+    against the tool registry. Otherwise (a plain answer, an unknown tool, invalid arguments or an
+    error) the same request goes to the large model. The small model is never streamed, so text it
+    writes alongside its decision doesn't reach the user.
+    """
+
+    def __init__(self, tool_runner: ToolRunner, policy: str = "first_step"):
+        if policy not in TOOL_SELECTION_POLICIES:
+            raise ValueError(f"Unknown tool selection policy: {policy}")
+        self.tool_runner = tool_runner
+        self.policy = policy
+        self.selections = 0
+        self.accepted = 0
+        self.fallbacks: Dict[str, int] = {"answered": 0, "invalid": 0, "error": 0}
+
+    def _uses_small_model(self, step: int) -> bool:
+        return self.policy == "tool_steps" or (self.policy == "first_step" and step == 1)
+
+    def _rejection(self, response: Optional[dict]) -> Optional[str]:
+        if not response:
+            return "error"
+        tool_calls = extract_llm_response(response).tool_calls
+        if not tool_calls:
+            return "answered"
+        for call in tool_calls:
+            try:
+                _, _, errors = self.tool_runner.check_tool_call(call)
+            except (KeyError, TypeError, AttributeError):
+                errors = ["malformed tool call"]
+            if errors:
+                print(f"Small model made an invalid tool call: {'; '.join(errors)}")
+                return "invalid"
+        return None
+
+    def wrap(self, select: Callable[[List[Message]], Awaitable[Optional[dict]]],
+             send: Callable[[List[Message], bool], Awaitable[Optional[dict]]]
+             ) -> Callable[[List[Message], bool], Awaitable[Optional[dict]]]:
+        """
+        Build the send function of one turn for AgentLoop.run: select(messages) asks the small model,
+        send(messages, allow_tools) the large one.
+        """
+        if self.policy == "off":
+            return send
+        step = 0
+
+        async def routed_send(messages: List[Message], allow_tools: bool) -> Optional[dict]:
+            nonlocal step
+            step += 1
+            if not allow_tools or not self._uses_small_model(step):
+                return await send(messages, allow_tools)
+
+            self.selections += 1
+            selection = await select(messages)
+            rejection = self._rejection(selection)
+            if rejection is None:
+                self.accepted += 1
+                return selection
+            self.fallbacks[rejection] += 1
+            response = await send(messages, allow_tools)
+            if response and selection and selection.get("usage"):
+                # The turn's token budget covers both requests
+                usage = response.get("usage") or {}
+                response["usage"] = {
+                    "prompt_tokens": usage.get("prompt_tokens", 0) + selection["usage"].get("prompt_tokens", 0),
+                    "completion_tokens": usage.get("completion_tokens", 0) + selection["usage"].get("completion_tokens", 0),
+                    "total_tokens": _total_tokens(usage) + _total_tokens(selection["usage"]),
+                }
+            return response
+
+        return routed_send
+
+    def stats(self) -> Dict:
+        return {
+            "policy": self.policy,
+            "selections": self.selections,
+            "accepted": self.accepted,
+            "fallbacks": dict(self.fallbacks),
+        }
@@ -0,0 +1,140 @@
+# page_fetcher.py
+import asyncio
+import codecs
+import os
+from html.parser import HTMLParser
+from typing import List
+
+import aiohttp
+
+from deadlines import cap
+from http_pool import get_session, request_timeout
+from telemetry import metrics, span
+
+# Per-page timeout and the overall deadline for fetching every page of one search
+PAGE_TIMEOUT = float(os.getenv("PAGE_FETCH_TIMEOUT", "10"))
+FETCH_DEADLINE = float(os.getenv("PAGE_FETCH_DEADLINE", "8"))
+
+# Stop reading a page after this many bytes, even if no summary was found yet
+MAX_PAGE_BYTES = int(os.getenv("PAGE_FETCH_MAX_BYTES", str(512 * 1024)))
+CHUNK_SIZE = 16 * 1024
+
+SUMMARY_PARAGRAPHS = 3
+SUMMARY_CHARS = 300
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml")
+
+# Tags whose start or end implicitly closes an open paragraph
+BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "body", "div", "dl", "fieldset", "footer", "form",
+    "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li", "main", "nav", "ol", "p", "pre",
+    "section", "table", "td", "th", "ul",
+}
+SKIP_TAGS = {"script", "style", "noscript", "template"}
+
+PAGE_FETCH_SECONDS = metrics.histogram("page_fetch_seconds", "Duration of fetching search result pages", ("outcome",))
+
+
+class ParagraphExtractor(HTMLParser):
+    """
+    Incremental parser that collects the text of the first few <p> elements without building a DOM.
+    Feed it chunks as they arrive and stop once `done` is set.
+    """
+
+    def __init__(self, max_paragraphs: int = SUMMARY_PARAGRAPHS, max_chars: int = SUMMARY_CHARS):
+        super().__init__(convert_charrefs=True)
+        self.max_paragraphs = max_paragraphs
+        self.max_chars = max_chars
+        self.paragraphs: List[str] = []
+        self.current = None
+        self.skip_depth = 0
+        self.collected = 0
+        self.done = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self.skip_depth += 1
+        elif tag in BLOCK_TAGS:
+            self._close_paragraph()
+            if tag == "p":
+                self.current = []
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self.skip_depth = max(0, self.skip_depth - 1)
+        elif tag in BLOCK_TAGS:
+            self._close_paragraph()
+
+    def handle_data(self, data):
+        if self.current is not None and not self.skip_depth and not self.done:
+            self.current.append(data)
+            self.collected += len(data)
+            if self.collected > self.max_chars:
+                # Enough text for the summary, no need to wait for the closing tag
+                self._close_paragraph()
+                self.done = True
+
+    def _close_paragraph(self):
+        if self.current is None:
+            return
+        self.paragraphs.append("".join(self.current))
+        self.current = None
+        if len(self.paragraphs) >= self.max_paragraphs:
+            self.done = True
+
+    def summary(self) -> str:
+        self._close_paragraph()
+        text = ' '.join(self.paragraphs[:self.max_paragraphs])
+        return text[:self.max_chars] + '...' if text else "No summary available."
+
+
+async def fetch_page_summary(url: str, headers: dict) -> str:
+    """Fetch the content summary of a given URL."""
+    with span("page.fetch", PAGE_FETCH_SECONDS, url=url) as fetch_span:
+        try:
+            async with get_session().get(url, headers=headers, timeout=request_timeout(PAGE_TIMEOUT)) as response:
+                response.raise_for_status()
+                if response.content_type not in HTML_CONTENT_TYPES:
+                    fetch_span.set(outcome="not_html")
+                    return "No summary available."
+
+                try:
+                    decoder = codecs.getincrementaldecoder(response.charset or 'utf-8')(errors='replace')
+                except LookupError:
+                    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+                # Parse the page as it streams in and stop reading once the summary is complete
+                extractor = ParagraphExtractor()
+                received = 0
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    received += len(chunk)
+                    extractor.feed(decoder.decode(chunk))
+                    if extractor.done or received >= MAX_PAGE_BYTES:
+                        break
+                fetch_span.set(bytes=received)
+                return extractor.summary()
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            fetch_span.set(outcome="error", error=str(e) or type(e).__name__)
+            return "Could not retrieve content."
+
+
+async def fetch_page_summaries(urls: List[str], headers: dict, deadline: float = FETCH_DEADLINE) -> List[str]:
+    """
+    Fetch the summaries of several pages concurrently.
+    Pages that have not finished when the deadline expires are cancelled and reported as unavailable.
+    Neither the deadline nor a page's timeout extends past the deadline of the current turn.
+    """
+    tasks = [asyncio.ensure_future(fetch_page_summary(url, headers)) for url in urls]
+    if not tasks:
+        return []
+    try:
+        _, pending = await asyncio.wait(tasks, timeout=cap(deadline))
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+    return [
+        "Could not retrieve content in time." if task in pending else task.result()
+        for task in tasks
+    ]
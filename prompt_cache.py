@@ -0,0 +1,54 @@
+# prompt_cache.py
+from typing import Dict, List, Optional
+
+import json_codec
+from messages import Message
+
+
+class PromptPrefix:
+    """
+    The part of every chat completion request that never changes: model, tool definitions, system message
+    and backend caching hints. It is serialized once at startup and requests are built by appending only
+    the conversation messages. Because earlier messages are sent unchanged turn after turn, the backend
+    sees the same prompt prefix and can reuse its KV cache.
+
+    cache_hints selects backend-specific prompt caching options:
+        ollama:   keep the model loaded between requests (keep_alive)
+        llamacpp: reuse the KV cache of the matching prompt prefix (cache_prompt)
+        openai:   route requests of one conversation to the same prompt cache (prompt_cache_key)
+    """
+
+    def __init__(self, model: str, tools: List[Dict], system_message: Message, cache_hints=("ollama",),
+                 keep_alive: str = "-1"):
+        self.system_message = system_message
+        self.cache_hints = set(cache_hints)
+
+        static_fields = {"model": model, "tools": tools}
+        if "ollama" in self.cache_hints:
+            static_fields["keep_alive"] = keep_alive
+        if "llamacpp" in self.cache_hints:
+            static_fields["cache_prompt"] = True
+        # Serialized without the closing brace, so per-request fields and messages can follow
+        self._head = json_codec.dumps(static_fields)[:-1]
+        self._system_json = system_message.to_json()
+
+    def _encode_message(self, message: Message) -> bytes:
+        if message is self.system_message or message == self.system_message:
+            return self._system_json
+        # Encoding a message is about as cheap as looking it up in a cache keyed by its content
+        return message.to_json()
+
+    def build(self, messages: List[Message], cache_key: Optional[str] = None, **fields) -> bytes:
+        """
+        Serialize a request body for the given conversation. Extra fields such as stream or tool_choice
+        are added after the static prefix.
+        """
+        if cache_key and "openai" in self.cache_hints:
+            fields["prompt_cache_key"] = cache_key
+        parts = [self._head]
+        for name, value in fields.items():
+            parts.append(b"," + json_codec.dumps(name) + b":" + json_codec.dumps(value))
+        parts.append(b',"messages":[')
+        parts.append(b",".join(self._encode_message(message) for message in messages))
+        parts.append(b"]}")
+        return b"".join(parts)
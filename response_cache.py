@@ -0,0 +1,217 @@
+# response_cache.py
+import os
+import time
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from tool_cache import fold_text
+
+# Category of answers that didn't use any tool
+GENERAL = "general"
+
+
+def parse_ttls(spec: str) -> Dict[str, float]:
+    """
+    Parse RESPONSE_CACHE_TTLS: comma-separated category=seconds pairs, e.g. 'weather=600,encyclopedia=604800'.
+    """
+    ttls = {}
+    for pair in spec.split(","):
+        category, _, seconds = pair.partition("=")
+        if category.strip() and seconds.strip():
+            ttls[category.strip()] = float(seconds)
+    return ttls
+
+
+# Punctuation that only shapes the sentence; every other symbol is kept as a token of its own,
+# since it can change the meaning ('2+2' vs '2-2', 'C++' vs 'C#')
+SENTENCE_PUNCTUATION = frozenset("?!,;:'\"()[]{}`")
+
+# Words that say little about what a question is about; they barely count towards similarity
+STOP_WORDS = frozenset("""
+a an the is are was were be been am do does did of in on at to for from by with about and or
+what whats who whos whom which when where how why s t me my i you your we our it its this that
+please tell can could would will should give show there here now
+""".split())
+
+
+def embed(text: str, dim: int = 1024) -> np.ndarray:
+    """
+    Unit vector of the hashed words, character trigrams and ordered content word pairs of normalized
+    text. Content words and their order carry most of the weight, so questions about different places
+    or people, or with their subjects swapped, stay apart, while the trigrams absorb small differences
+    in spelling and inflection.
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    features = []
+    content_words = []
+    for word in text.split():
+        if word in STOP_WORDS:
+            features.append((word, 0.25))
+            continue
+        content_words.append(word)
+        features.append((word, 2.0))
+        padded = f" {word} "
+        features.extend((padded[i:i + 3], 0.5) for i in range(len(padded) - 2))
+    # Pairs of consecutive content words keep their order, so 'python faster java' and 'java faster python'
+    # don't end up with the same vector
+    features.extend((f"{first} > {second}", 2.0) for first, second in zip(content_words, content_words[1:]))
+    for feature, weight in features:
+        h = zlib.crc32(feature.encode())
+        # The sign bit halves the damage of two features landing in the same dimension
+        vector[h % dim] += weight if h & 0x80000000 else -weight
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class ResponseCache:
+    """
+    Answers to standalone questions, found again by exact normalized text or by similarity.
+
+    Prompts are case-folded and stripped of sentence punctuation, while symbols such as + - * / # $ and
+    decimal points stay as tokens; an identical prompt is a dictionary lookup. Otherwise the prompt's
+    hashed n-gram vector is compared with every cached one in a single NumPy matrix product, and the
+    nearest entry counts as a hit when its cosine similarity reaches threshold, it has exactly the
+    same numbers and symbols, and the content words both share come in the same order.
+    Entries live in a fixed-size matrix; when it is full the oldest entry is overwritten.
+
+    Each answer expires after the shortest TTL of the tool categories it was grounded on (see ttls),
+    so weather answers go stale quickly while encyclopedic ones are kept for long. Answers that used a
+    tool without a configured category are not cached.
+    """
+
+    def __init__(self, ttls: Dict[str, float], threshold: float = 0.9, maxsize: int = 2000, dim: int = 1024):
+        self.ttls = ttls
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.dim = dim
+        self.hits = 0
+        self.misses = 0
+        self._vectors = np.zeros((maxsize, dim), dtype=np.float32)
+        self._expires_at = np.zeros(maxsize, dtype=np.float64)
+        self._entries: List[Optional[Tuple[str, str]]] = [None] * maxsize  # (normalized prompt, answer)
+        self._slots: Dict[str, int] = {}
+        self._next = 0
+        self._size = 0
+
+    @staticmethod
+    def normalize(prompt: str) -> str:
+        chars = []
+        for i, char in enumerate(prompt):
+            if char.isalnum() or char.isspace():
+                chars.append(char)
+            elif char in SENTENCE_PUNCTUATION or (char == "." and not (
+                    0 < i < len(prompt) - 1 and prompt[i - 1].isdigit() and prompt[i + 1].isdigit())):
+                # A period only matters inside a number
+                chars.append(" ")
+            else:
+                chars.append(f" {char} ")
+        return fold_text("".join(chars))
+
+    @staticmethod
+    def exact_tokens(text: str) -> Tuple[str, ...]:
+        """Numbers and symbols of normalized text; a similar question only matches if these are identical."""
+        return tuple(token for token in text.split() if not token.isalpha())
+
+    @staticmethod
+    def same_word_order(cached: str, text: str) -> bool:
+        """Whether the content words two normalized questions share appear in the same order in both."""
+        cached_words, words = cached.split(), text.split()
+        shared = (set(cached_words) & set(words)) - STOP_WORDS
+        return [word for word in cached_words if word in shared] == [word for word in words if word in shared]
+
+    def ttl_for(self, categories: Iterable[str]) -> Optional[float]:
+        """Seconds an answer grounded on these tool categories may be cached, or None if it may not."""
+        ttls = [self.ttls.get(category) for category in set(categories) or {GENERAL}]
+        if not ttls or None in ttls:
+            return None
+        return min(ttls)
+
+    def get(self, prompt: str) -> Optional[str]:
+        text = self.normalize(prompt)
+        if not text:
+            return None
+        now = time.time()
+        slot = self._slots.get(text)
+        if slot is None and self._size:
+            scores = self._vectors[:self._size] @ embed(text, self.dim)
+            scores[self._expires_at[:self._size] <= now] = -1.0
+            best = int(np.argmax(scores))
+            # Questions that differ only in a number or an operator, or in the order of their subjects,
+            # are close in vector space but have different answers
+            cached = self._entries[best][0] if scores[best] >= self.threshold else None
+            if (cached is not None and self.exact_tokens(cached) == self.exact_tokens(text)
+                    and self.same_word_order(cached, text)):
+                slot = best
+        if slot is None or self._expires_at[slot] <= now:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self._entries[slot][1]
+
+    def set(self, prompt: str, answer: str, categories: Iterable[str] = ()):
+        ttl = self.ttl_for(categories)
+        text = self.normalize(prompt)
+        if not ttl or not text or not answer:
+            return
+        slot = self._slots.get(text)
+        if slot is None:
+            slot = self._next
+            self._next = (self._next + 1) % self.maxsize
+            self._size = max(self._size, slot + 1)
+            previous = self._entries[slot]
+            if previous is not None:
+                del self._slots[previous[0]]
+            self._slots[text] = slot
+        self._vectors[slot] = embed(text, self.dim)
+        self._expires_at[slot] = time.time() + ttl
+        self._entries[slot] = (text, answer)
+
+    def clear(self):
+        self._slots.clear()
+        self._entries = [None] * self.maxsize
+        self._expires_at[:] = 0
+        self._next = self._size = 0
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._slots),
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def create_response_cache() -> Optional[ResponseCache]:
+    """
+    Build the cache when RESPONSE_CACHE is enabled, otherwise return None.
+    """
+    if os.getenv("RESPONSE_CACHE", "false").lower() not in ("1", "true", "yes"):
+        return None
+    return ResponseCache(
+        parse_ttls(os.getenv("RESPONSE_CACHE_TTLS", "general=86400,encyclopedia=604800,search=3600,weather=600")),
+        threshold=float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.9")),
+        maxsize=int(os.getenv("RESPONSE_CACHE_MAX", "2000")),
+    )
+
+
+# Questions that look alike but must not share an answer; run `python response_cache.py` to check them
+CONFUSABLE_QUESTIONS = (
+    ("What is 2+2?", "What is 2-2?"),
+    ("What is 2+2?", "what is 2*2"),
+    ("Is C++ faster than C#?", "Is C faster than C?"),
+    ("Is Python faster than Java?", "Is Java faster than Python?"),
+    ("How do I convert Celsius to Fahrenheit?", "How do I convert Fahrenheit to Celsius?"),
+    ("For a typical web backend serving many concurrent requests under heavy load, is Python faster than Java?",
+     "For a typical web backend serving many concurrent requests under heavy load, is Java faster than Python?"),
+)
+
+if __name__ == "__main__":
+    for cached_question, question in CONFUSABLE_QUESTIONS:
+        cache = ResponseCache({GENERAL: 60})
+        cache.set(cached_question, "cached answer")
+        assert cache.get(cached_question) == "cached answer", cached_question
+        assert cache.get(question) is None, f"{question!r} was answered with the answer to {cached_question!r}"
+    print(f"{len(CONFUSABLE_QUESTIONS)} confusable question pairs kept apart")
@@ -0,0 +1,287 @@
+# session_store.py
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional
+
+import json_codec
+from messages import Message, message_from_dict
+
+
+class SessionStore:
+    """
+    Storage interface for per-session conversation history.
+    """
+
+    def load(self, session_id: str) -> Optional[List[Message]]:
+        """Return a copy of the session's messages, or None if the session is unknown or expired."""
+        raise NotImplementedError
+
+    async def aload(self, session_id: str) -> Optional[List[Message]]:
+        """load for use on the event loop; stores doing blocking I/O run it elsewhere."""
+        return self.load(session_id)
+
+    def append(self, session_id: str, messages: List[Message], history: Optional[List[Message]] = None):
+        """
+        Append messages to the session, creating it if needed. history is the whole conversation the
+        messages end; if the session was evicted or expired meanwhile, it is stored instead, so the
+        session isn't recreated without its system message and earlier turns.
+        """
+        raise NotImplementedError
+
+    def replace(self, session_id: str, messages: List[Message]):
+        """Overwrite the session's history, e.g. after it was compacted."""
+        raise NotImplementedError
+
+    def delete(self, session_id: str):
+        raise NotImplementedError
+
+    def purge_expired(self) -> int:
+        """Remove sessions idle for longer than the TTL and return how many were removed."""
+        return 0
+
+    async def flush(self):
+        """Wait until the writes made so far are stored."""
+
+    def close(self):
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    """
+    Process-local store that evicts the least recently used sessions beyond max_sessions
+    and sessions idle for longer than ttl seconds.
+    """
+
+    def __init__(self, max_sessions: int = 10000, ttl: Optional[float] = 86400):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expired(self, last_access: float, now: float) -> bool:
+        return self.ttl is not None and now - last_access > self.ttl
+
+    def _touch(self, session_id: str, messages: List[Message]):
+        self._sessions[session_id] = (messages, time.monotonic())
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def load(self, session_id):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            messages, last_access = entry
+            if self._expired(last_access, time.monotonic()):
+                del self._sessions[session_id]
+                return None
+            self._touch(session_id, messages)
+            return list(messages)
+
+    def append(self, session_id, messages, history=None):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry and not self._expired(entry[1], time.monotonic()):
+                stored = entry[0]
+                stored.extend(messages)
+            else:
+                stored = list(history if history is not None else messages)
+            self._touch(session_id, stored)
+
+    def replace(self, session_id, messages):
+        with self._lock:
+            self._touch(session_id, list(messages))
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def purge_expired(self):
+        if self.ttl is None:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            expired = [session_id for session_id, (_, last_access) in self._sessions.items()
+                       if self._expired(last_access, now)]
+            for session_id in expired:
+                del self._sessions[session_id]
+        return len(expired)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Durable store in a SQLite database in WAL mode, so several worker processes can share sessions.
+    Each message is one row, so appending a turn never rewrites the earlier history.
+
+    Every statement runs on one thread with its own connection, so waiting for another worker's write
+    lock never stalls the event loop. Writes are queued in order and return at once; loads are queued
+    behind them, so a load always sees the process's earlier writes.
+    """
+
+    def __init__(self, path: str, ttl: Optional[float] = 86400):
+        self.path = path
+        self.ttl = ttl
+        self._db: Optional[_Transaction] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-store")
+        self._call(self._create_tables).result()
+
+    def _call(self, function, *args) -> Future:
+        return self._executor.submit(function, *args)
+
+    def _write(self, function, *args):
+        self._call(function, *args).add_done_callback(self._report_error)
+
+    @staticmethod
+    def _report_error(future: Future):
+        if not future.cancelled() and future.exception() is not None:
+            print(f"Error writing session: {future.exception()}")
+
+    def _connection(self) -> "_Transaction":
+        # Only ever called on the store's thread
+        if self._db is None:
+            db = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._db = _Transaction(db)
+        return self._db
+
+    def _create_tables(self):
+        with self._connection() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, last_access REAL NOT NULL)")
+            db.execute("CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions (last_access)")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                " session_id TEXT NOT NULL, seq INTEGER NOT NULL, body BLOB NOT NULL,"
+                " PRIMARY KEY (session_id, seq)) WITHOUT ROWID"
+            )
+
+    def _expired_before(self) -> float:
+        return time.time() - self.ttl if self.ttl is not None else float("-inf")
+
+    def load(self, session_id):
+        return self._call(self._load, session_id).result()
+
+    async def aload(self, session_id):
+        return await asyncio.wrap_future(self._call(self._load, session_id))
+
+    def _load(self, session_id):
+        with self._connection() as db:
+            row = db.execute("SELECT last_access FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            if row is None:
+                return None
+            if row[0] < self._expired_before():
+                self._delete(db, session_id)
+                return None
+            db.execute("UPDATE sessions SET last_access = ? WHERE session_id = ?", (time.time(), session_id))
+            rows = db.execute("SELECT body FROM messages WHERE session_id = ? ORDER BY seq", (session_id,)).fetchall()
+        return [message_from_dict(json_codec.loads(body)) for (body,) in rows]
+
+    def append(self, session_id, messages, history=None):
+        self._write(self._append_now, session_id, list(messages), list(history) if history is not None else None)
+
+    def _append_now(self, session_id, messages, history):
+        with self._connection() as db:
+            if history is not None and db.execute(
+                    "SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)).fetchone() is None:
+                # Purged while its turn ran; store the whole conversation again
+                db.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                messages = history
+            self._append(db, session_id, messages)
+
+    def _append(self, db, session_id, messages):
+        db.execute(
+            "INSERT INTO sessions (session_id, last_access) VALUES (?, ?)"
+            " ON CONFLICT (session_id) DO UPDATE SET last_access = excluded.last_access",
+            (session_id, time.time()),
+        )
+        (next_seq,) = db.execute(
+            "SELECT COALESCE(MAX(seq), -1) + 1 FROM messages WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        db.executemany(
+            "INSERT INTO messages (session_id, seq, body) VALUES (?, ?, ?)",
+            [(session_id, next_seq + offset, message.to_json()) for offset, message in enumerate(messages)],
+        )
+
+    def replace(self, session_id, messages):
+        # Copied, since the caller keeps changing its list while the write waits in the queue
+        self._write(self._replace_now, session_id, list(messages))
+
+    def _replace_now(self, session_id, messages):
+        with self._connection() as db:
+            db.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self._append(db, session_id, messages)
+
+    def delete(self, session_id):
+        self._write(self._delete_now, session_id)
+
+    def _delete_now(self, session_id):
+        with self._connection() as db:
+            self._delete(db, session_id)
+
+    @staticmethod
+    def _delete(db, session_id):
+        db.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+        db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def purge_expired(self):
+        if self.ttl is None:
+            return 0
+        return self._call(self._purge_expired).result()
+
+    def _purge_expired(self):
+        with self._connection() as db:
+            cutoff = self._expired_before()
+            db.execute(
+                "DELETE FROM messages WHERE session_id IN (SELECT session_id FROM sessions WHERE last_access < ?)",
+                (cutoff,),
+            )
+            return db.execute("DELETE FROM sessions WHERE last_access < ?", (cutoff,)).rowcount
+
+    async def flush(self):
+        await asyncio.wrap_future(self._call(lambda: None))
+
+    def close(self):
+        # Queued writes run first, then the connection is closed on the thread that opened it
+        self._call(self._close).result()
+        self._executor.shutdown()
+
+    def _close(self):
+        if self._db is not None:
+            self._db.connection.close()
+            self._db = None
+
+
+class _Transaction:
+    """
+    Wraps an autocommit connection so `with` runs the block in one IMMEDIATE transaction,
+    taking the write lock up front instead of failing to upgrade a read lock under contention.
+    """
+
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def __exit__(self, exc_type, exc, tb):
+        self.connection.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+def create_session_store() -> SessionStore:
+    """
+    Build the session store selected by SESSION_BACKEND ('memory' or 'sqlite').
+    """
+    ttl = float(os.getenv("SESSION_TTL", "86400")) or None
+    backend = os.getenv("SESSION_BACKEND", "memory").lower()
+    if backend == "sqlite":
+        return SQLiteSessionStore(os.getenv("SESSION_DB_PATH", "sessions.db"), ttl=ttl)
+    if backend == "memory":
+        return MemorySessionStore(max_sessions=int(os.getenv("SESSION_MAX", "10000")), ttl=ttl)
+    raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
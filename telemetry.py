@@ -0,0 +1,267 @@
+# telemetry.py
+"""
+Metrics and per-turn tracing for the chat pipeline.
+
+Metrics are kept in process and rendered in the Prometheus text format for /metrics. Each worker
+process reports its own values, so scrape every worker (or run one per container).
+
+Spans time the steps of a turn (LLM requests, tool calls, page fetches) and nest through a context
+variable, so concurrent tool calls each end up under the turn that started them. A span can feed a
+histogram with its duration, labelled from the span's attributes. With TRACE_LOG enabled every
+finished turn is printed as one JSON line, and when OTEL_EXPORTER_OTLP_ENDPOINT is set and the
+OpenTelemetry SDK and OTLP exporter are installed, spans are also exported to that collector.
+"""
+import asyncio
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import json_codec
+
+# Upper bounds in seconds, from fast cache hits to slow model answers
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """A monotonically increasing value per label combination."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value:g}"
+
+
+class Gauge:
+    """A value read when metrics are rendered, e.g. the number of open WebSockets."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, read: Callable[[], float]):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def samples(self) -> Iterator[str]:
+        yield f"{self.name} {float(self.read()):g}"
+
+
+class Histogram:
+    """Counts of observed values per bucket, with their sum, per label combination."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple, list] = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            series = [(key, list(values)) for key, values in self._series.items()]
+        for key, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                labels = _format_labels(self.labelnames, key, 'le="' + le + '"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {values[-1]:g}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class MetricsRegistry:
+    """
+    Every metric of the process by name. Modules create their metrics at import time, next to the code
+    that updates them; creating a metric that already exists returns the existing one.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_add(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_add(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, read: Callable[[], float]) -> Gauge:
+        gauge = Gauge(name, help, read)
+        with self._lock:
+            self._metrics[name] = gauge  # Re-registering replaces the reader, e.g. after a reload
+        return gauge
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_add(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                lines.extend(metric.samples())
+            except Exception as e:
+                print(f"Could not read metric {metric.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+class Span:
+    """One timed step of a turn, with attributes and the spans started inside it."""
+
+    __slots__ = ("name", "attributes", "started", "duration", "children")
+
+    def __init__(self, name: str, attributes: Dict):
+        self.name = name
+        self.attributes = attributes
+        self.started = time.monotonic()
+        self.duration: Optional[float] = None
+        self.children: List["Span"] = []
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def to_dict(self) -> Dict:
+        data = {"name": self.name, "ms": round((self.duration if self.duration is not None else self.elapsed()) * 1000, 1)}
+        data.update((key, value) for key, value in self.attributes.items() if value is not None)
+        if self.children:
+            data["children"] = [child.to_dict() for child in self.children]
+        return data
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+# Print every finished turn as a JSON line
+TRACE_LOG = os.getenv("TRACE_LOG", "false").lower() in ("1", "true", "yes")
+
+# OpenTelemetry tracer, set by setup_tracing when export is configured
+_tracer = None
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, histogram: Optional[Histogram] = None, **attributes) -> Iterator[Span]:
+    """
+    Time the block as a child of the current span. Attributes can be added while it runs with
+    span.set(...). On exit the duration is observed in histogram (if given), labelled with the span
+    attributes of the same names; an 'outcome' label defaults to ok, error or cancelled.
+    """
+    current = Span(name, attributes)
+    parent = _current_span.get()
+    if parent is not None:
+        parent.children.append(current)
+    token = _current_span.set(current)
+    with ExitStack() as stack:
+        otel_span = stack.enter_context(_tracer.start_as_current_span(name)) if _tracer is not None else None
+        try:
+            yield current
+        except asyncio.CancelledError:
+            current.attributes.setdefault("outcome", "cancelled")
+            raise
+        except BaseException as e:
+            current.attributes.setdefault("outcome", "error")
+            current.attributes.setdefault("error", str(e) or type(e).__name__)
+            raise
+        finally:
+            current.duration = current.elapsed()
+            current.attributes.setdefault("outcome", "ok")
+            _current_span.reset(token)
+            if histogram is not None:
+                histogram.observe(current.duration, **{label: current.attributes.get(label, "")
+                                                       for label in histogram.labelnames})
+            if otel_span is not None:
+                otel_span.set_attributes({key: value for key, value in current.attributes.items()
+                                          if isinstance(value, (str, bool, int, float))})
+            if parent is None and TRACE_LOG:
+                print(f"Trace: {json_codec.dumps(current.to_dict()).decode()}")
+
+
+def setup_tracing(service_name: str = "basic-agent-chat"):
+    """
+    Export spans over OTLP/HTTP when OTEL_EXPORTER_OTLP_ENDPOINT is set (e.g. http://localhost:4318).
+    Needs the opentelemetry-sdk and opentelemetry-exporter-otlp-proto-http packages.
+    """
+    global _tracer
+    if not os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+        return
+    try:
+        from opentelemetry import trace
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError as e:
+        print(f"OpenTelemetry export is disabled, a package is missing: {e}")
+        return
+    provider = TracerProvider(resource=Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", service_name)}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+    _tracer = trace.get_tracer("basic-agent-chat")
+
+
+def shutdown_tracing():
+    """Flush spans that haven't been exported yet."""
+    if _tracer is None:
+        return
+    from opentelemetry import trace
+    provider = trace.get_tracer_provider()
+    if hasattr(provider, "shutdown"):
+        provider.shutdown()
@@ -0,0 +1,227 @@
+# tool_cache.py
+import asyncio
+import inspect
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Union
+
+# Sentinel returned by cache backends on a miss, since None is a valid tool result
+MISSING = object()
+
+# Every ToolCache created by custom_tool, by tool name, so stats can be reported in one place
+tool_caches: Dict[str, "ToolCache"] = {}
+
+
+def fold_text(value: Any) -> Any:
+    """
+    Normalize free-text arguments so trivially different calls share a cache entry:
+    case-folded, trimmed, with internal whitespace collapsed.
+    """
+    if isinstance(value, str):
+        return " ".join(value.casefold().split())
+    return value
+
+
+class CacheBackend:
+    """
+    Storage interface for tool results. Implement get/set/clear to plug in another store.
+    """
+
+    def get(self, key: Hashable) -> Any:
+        """Return the cached value, or MISSING if absent or expired."""
+        raise NotImplementedError
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float]):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        return 0
+
+
+class LRUCache(CacheBackend):
+    """
+    Thread-safe in-process LRU cache with per-entry expiry.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.evictions = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return MISSING
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class _Flight:
+    """An in-progress call of a blocking tool that other threads can wait on."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+
+class ToolCache:
+    """
+    Result cache for one tool, with argument normalization and single-flight deduplication:
+    concurrent identical calls wait for the first one instead of each hitting the upstream service.
+    """
+
+    def __init__(self, name: str, signature: inspect.Signature, ttl: Union[float, Callable[[], float], None] = None, maxsize: int = 1024,
+                 normalize: Optional[Dict[str, Callable[[Any], Any]]] = None, backend: Optional[CacheBackend] = None,
+                 cache_if: Optional[Callable[[Any], bool]] = None):
+        self.name = name
+        self.signature = signature
+        self.ttl = ttl
+        self.normalize = normalize or {}
+        self.backend = backend if backend is not None else LRUCache(maxsize)
+        self.cache_if = cache_if
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._sync_flights: Dict[Hashable, _Flight] = {}
+        self._async_flights: Dict[Hashable, asyncio.Future] = {}
+
+    def make_key(self, args, kwargs) -> Hashable:
+        bound = self.signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        parts = []
+        for name, value in bound.arguments.items():
+            normalizer = self.normalize.get(name)
+            if normalizer:
+                value = normalizer(value)
+            try:
+                hash(value)
+            except TypeError:
+                value = repr(value)
+            parts.append((name, value))
+        return tuple(parts)
+
+    def _store(self, key, value):
+        # Failed calls return None; tools can also reject error strings with cache_if
+        if value is None or (self.cache_if and not self.cache_if(value)):
+            return
+        # A callable TTL is evaluated per entry, e.g. to expire at the provider's next update
+        self.backend.set(key, value, self.ttl() if callable(self.ttl) else self.ttl)
+
+    def call(self, func: Callable, args, kwargs) -> Any:
+        """Return the cached result of a blocking tool, calling it at most once per key at a time."""
+        key = self.make_key(args, kwargs)
+        value = self.backend.get(key)
+        if value is not MISSING:
+            self.hits += 1
+            return value
+
+        with self._lock:
+            flight = self._sync_flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._sync_flights[key] = _Flight()
+
+        if not leader:
+            flight.event.wait()
+            self.coalesced += 1
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        self.misses += 1
+        try:
+            flight.value = func(*args, **kwargs)
+            self._store(key, flight.value)
+            return flight.value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._sync_flights.pop(key, None)
+            flight.event.set()
+
+    async def acall(self, func: Callable, args, kwargs) -> Any:
+        """Async counterpart of call, sharing one in-flight coroutine between identical concurrent calls."""
+        key = self.make_key(args, kwargs)
+        loop = asyncio.get_running_loop()
+        while True:
+            value = self.backend.get(key)
+            if value is not MISSING:
+                self.hits += 1
+                return value
+            flight = self._async_flights.get(key)
+            if flight is None or flight.get_loop() is not loop:
+                break
+            try:
+                value = await asyncio.shield(flight)
+                self.coalesced += 1
+                return value
+            except asyncio.CancelledError:
+                if not flight.cancelled():
+                    raise
+                # The leading call was cancelled rather than this one, so try again
+
+        self.misses += 1
+        flight = self._async_flights[key] = loop.create_future()
+        try:
+            value = await func(*args, **kwargs)
+            self._store(key, value)
+            flight.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except BaseException as e:
+            flight.set_exception(e)
+            flight.exception()  # Mark as retrieved when nobody else was waiting
+            raise
+        finally:
+            if self._async_flights.get(key) is flight:
+                del self._async_flights[key]
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "size": len(self.backend),
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+        }
+
+
+def cache_stats() -> Dict[str, dict]:
+    """Hit/miss counters for every cached tool."""
+    return {name: cache.stats() for name, cache in tool_caches.items()}
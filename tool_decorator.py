@@ -1,37 +1,123 @@
 # tool_decorator.py
+import asyncio
+import functools
 import inspect
-from typing import Callable
+import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Union
+
+from tool_cache import CacheBackend, ToolCache, tool_caches
+from tool_registry import build_tool_definition, registry
+
+# Shared thread pool for blocking tools, created on first use
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    Return the bounded thread pool that runs blocking tools off the event loop.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=int(os.getenv("TOOL_MAX_WORKERS", "8")), thread_name_prefix="tool")
+        return _executor
+
+
+def shutdown_executor():
+    """
+    Stop the blocking-tool thread pool without waiting for calls that are still running.
+    """
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def custom_tool(func: Optional[Callable] = None, *, cache_ttl: Union[float, Callable[[], float], None] = None,
+                cache_maxsize: int = 1024, cache_normalize: Optional[Dict[str, Callable[[Any], Any]]] = None,
+                cache_backend: Optional[CacheBackend] = None,
+                cache_if: Optional[Callable[[Any], bool]] = None,
+                timeout: Optional[float] = None, max_concurrency: Optional[int] = None,
+                category: Optional[str] = None) -> Callable:
+    """
+    Turn a function into a tool with an OpenAI-style tool definition and register it in the tool registry.
+    The JSON Schema comes from the type hints and the descriptions from the docstring (see tool_registry).
+
+    Both `async def` and blocking functions can be tools. The decorated function keeps its own calling
+    convention, and `await tool.acall(...)` runs either kind without blocking the event loop: async tools
+    are awaited directly and blocking tools run in the shared tool thread pool.
+
+    Use as @custom_tool, or with options:
+        cache_ttl: seconds a result stays cached, or a function returning them per result (enables caching).
+        cache_maxsize: max entries in the default in-process LRU.
+        cache_normalize: per-argument functions applied before building the cache key, e.g. {'query': fold_text}.
+        cache_backend: alternative CacheBackend instead of the in-process LRU.
+        cache_if: predicate deciding whether a result may be cached (None results never are).
+        timeout: seconds acall waits for a result before raising asyncio.TimeoutError.
+        max_concurrency: max calls of this tool running at once through acall; extra calls wait.
+        category: kind of data the tool returns (e.g. 'weather'), deciding how long answers based on it are cached.
+    """
+    if func is None:
+        return lambda f: custom_tool(f, cache_ttl=cache_ttl, cache_maxsize=cache_maxsize, cache_normalize=cache_normalize,
+                                     cache_backend=cache_backend, cache_if=cache_if, timeout=timeout,
+                                     max_concurrency=max_concurrency, category=category)
 
-def custom_tool(func: Callable) -> Callable:
-    def wrapper(*args, **kwargs):
-        return func(*args, **kwargs)
-    
-    # Extract function signature and docstring
     sig = inspect.signature(func)
-    docstring = func.__doc__.strip() if func.__doc__ else "No description provided."
-    
-    # Extract parameter details
-    parameters = {}
-    for param_name, param in sig.parameters.items():
-        param_type = param.annotation.__name__ if param.annotation != inspect.Parameter.empty else "unknown"
-        parameters[param_name] = {
-            'type': param_type,
-            'description': f'The {param_name} parameter',
-        }
-    
-    # Create the tool definition
-    tool_definition = {
-        'type': 'function',
-        'function': {
-            'name': func.__name__,
-            'description': docstring,
-            'parameters': {
-                'type': 'object',
-                'properties': parameters,
-                'required': list(sig.parameters.keys()),
-            },
-        },
-    }
-    
-    wrapper.tool_definition = tool_definition
+    is_async = inspect.iscoroutinefunction(func)
+
+    cache = None
+    if cache_ttl is not None or cache_backend is not None:
+        cache = ToolCache(func.__name__, sig, ttl=cache_ttl, maxsize=cache_maxsize, normalize=cache_normalize,
+                          backend=cache_backend, cache_if=cache_if)
+        tool_caches[func.__name__] = cache
+
+    if is_async:
+        # Keep async tools awaitable so callers can detect and await them
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if cache is None:
+                return await func(*args, **kwargs)
+            return await cache.acall(func, args, kwargs)
+    else:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if cache is None:
+                return func(*args, **kwargs)
+            return cache.call(func, args, kwargs)
+
+    # asyncio semaphores belong to one event loop, so keep one per loop
+    semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+    async def run(args, kwargs):
+        if is_async:
+            pending = wrapper(*args, **kwargs)
+        else:
+            pending = asyncio.get_running_loop().run_in_executor(get_executor(), functools.partial(wrapper, *args, **kwargs))
+        # The timeout covers running the tool, not waiting for a concurrency slot
+        if timeout is not None:
+            return await asyncio.wait_for(pending, timeout)
+        return await pending
+
+    async def acall(*args, **kwargs):
+        if max_concurrency is None:
+            return await run(args, kwargs)
+        loop = asyncio.get_running_loop()
+        semaphore = semaphores.get(loop)
+        if semaphore is None:
+            semaphore = semaphores[loop] = asyncio.Semaphore(max_concurrency)
+        async with semaphore:
+            return await run(args, kwargs)
+
+    wrapper.acall = acall
+    wrapper.timeout = timeout
+    wrapper.max_concurrency = max_concurrency
+    wrapper.category = category
+    wrapper.tool_definition = build_tool_definition(func)
+    wrapper.cache = cache
+    wrapper.tool = registry.register(wrapper, wrapper.tool_definition)
     return wrapper
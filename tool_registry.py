@@ -0,0 +1,285 @@
+# tool_registry.py
+import collections.abc
+import inspect
+import re
+import typing
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# JSON Schema type for each supported Python annotation
+JSON_TYPES = {
+    str: "string",
+    int: "integer",
+    float: "number",
+    bool: "boolean",
+    list: "array",
+    tuple: "array",
+    dict: "object",
+}
+
+# Docstring lines that start the parameter/return sections, e.g. "Args:" or "### Parameters:"
+SECTION_HEADER = re.compile(r"^\s*(?:#+\s*)?(Args|Arguments|Parameters|Returns|Raises)\s*:\s*$", re.IGNORECASE)
+# Parameter lines in those sections, e.g. "location (str): ..." or "- `query` (str): ..."
+PARAM_LINE = re.compile(r"^\s*(?:[-*]\s*)?`?(\w+)`?\s*(?:\([^)]*\))?\s*:\s*(.+)$")
+
+TRUE_STRINGS = {"true", "yes", "1", "on"}
+FALSE_STRINGS = {"false", "no", "0", "off"}
+
+
+def parse_docstring(func: Callable) -> Tuple[str, Dict[str, str]]:
+    """
+    Split a tool's docstring into its description and per-parameter descriptions.
+    The description is everything before the first Args/Parameters/Returns section.
+    """
+    doc = inspect.cleandoc(func.__doc__) if func.__doc__ else ""
+    parameters = inspect.signature(func).parameters
+    description_lines = []
+    param_docs = {}
+    in_sections = False
+    for line in doc.splitlines():
+        if SECTION_HEADER.match(line):
+            in_sections = True
+            continue
+        if not in_sections:
+            description_lines.append(line)
+            continue
+        match = PARAM_LINE.match(line)
+        if match and match.group(1) in parameters:
+            param_docs.setdefault(match.group(1), match.group(2).strip())
+    description = "\n".join(description_lines).strip() or "No description provided."
+    return description, param_docs
+
+
+def annotation_schema(annotation: Any) -> Dict:
+    """
+    JSON Schema for a type annotation. Optional[X] maps to the schema of X;
+    unannotated parameters accept any JSON value.
+    """
+    if annotation is inspect.Parameter.empty or annotation is Any:
+        return {}
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+    if origin is typing.Union:
+        members = [arg for arg in args if arg is not type(None)]
+        return annotation_schema(members[0]) if len(members) == 1 else {}
+    if origin is typing.Literal:
+        schema = {"enum": list(args)}
+        kinds = {JSON_TYPES.get(type(arg)) for arg in args}
+        if len(kinds) == 1 and None not in kinds:
+            schema["type"] = kinds.pop()
+        return schema
+    if origin in (list, tuple, set, frozenset, collections.abc.Iterable, collections.abc.Sequence) or annotation in (list, tuple):
+        schema = {"type": "array"}
+        if args and args[0] is not Ellipsis:
+            schema["items"] = annotation_schema(args[0])
+        return schema
+    if origin is dict or annotation is dict:
+        return {"type": "object"}
+    if annotation in JSON_TYPES:
+        return {"type": JSON_TYPES[annotation]}
+    return {}
+
+
+def build_tool_definition(func: Callable) -> Dict:
+    """
+    OpenAI-style tool definition for a function, with JSON Schema types from its type hints and
+    descriptions from its docstring. Parameters without a default are required.
+    """
+    description, param_docs = parse_docstring(func)
+    hints = typing.get_type_hints(func)
+    properties = {}
+    required = []
+    for name, param in inspect.signature(func).parameters.items():
+        if param.kind in (param.VAR_POSITIONAL, param.VAR_KEYWORD):
+            continue
+        schema = annotation_schema(hints.get(name, param.annotation))
+        schema["description"] = param_docs.get(name, f"The {name} parameter")
+        if param.default is not param.empty and param.default is not None:
+            schema["default"] = param.default
+        properties[name] = schema
+        if param.default is param.empty:
+            required.append(name)
+
+    return {
+        'type': 'function',
+        'function': {
+            'name': func.__name__,
+            'description': description,
+            'parameters': {
+                'type': 'object',
+                'properties': properties,
+                'required': required,
+            },
+        },
+    }
+
+
+def _compile_coercer(schema: Dict) -> Callable[[Any], Any]:
+    """
+    Build a function that checks one argument against its schema and coerces the loose values
+    models commonly send ("3" for 3, "true" for true, a single value for a list).
+    Raises ValueError with a short reason when the value can't be used.
+    """
+    kind = schema.get("type")
+    enum = schema.get("enum")
+
+    if kind == "string":
+        def coerce(value):
+            if isinstance(value, str):
+                return value
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                return str(value)
+            raise ValueError("expected a string")
+    elif kind == "integer":
+        def coerce(value):
+            if isinstance(value, bool):
+                raise ValueError("expected an integer")
+            if isinstance(value, int):
+                return value
+            if isinstance(value, float) and value.is_integer():
+                return int(value)
+            if isinstance(value, str):
+                try:
+                    return int(value.strip())
+                except ValueError:
+                    pass
+            raise ValueError("expected an integer")
+    elif kind == "number":
+        def coerce(value):
+            if isinstance(value, bool):
+                raise ValueError("expected a number")
+            if isinstance(value, (int, float)):
+                return value
+            if isinstance(value, str):
+                try:
+                    return float(value.strip())
+                except ValueError:
+                    pass
+            raise ValueError("expected a number")
+    elif kind == "boolean":
+        def coerce(value):
+            if isinstance(value, bool):
+                return value
+            if isinstance(value, str) and value.strip().lower() in TRUE_STRINGS | FALSE_STRINGS:
+                return value.strip().lower() in TRUE_STRINGS
+            if value in (0, 1):
+                return bool(value)
+            raise ValueError("expected a boolean")
+    elif kind == "array":
+        coerce_item = _compile_coercer(schema.get("items", {}))
+
+        def coerce(value):
+            if not isinstance(value, (list, tuple)):
+                value = [value]
+            return [coerce_item(item) for item in value]
+    elif kind == "object":
+        def coerce(value):
+            if isinstance(value, dict):
+                return value
+            raise ValueError("expected an object")
+    else:
+        def coerce(value):
+            return value
+
+    if enum is None:
+        return coerce
+
+    allowed = ", ".join(str(option) for option in enum)
+
+    def coerce_enum(value):
+        value = coerce(value)
+        if value not in enum:
+            raise ValueError(f"expected one of: {allowed}")
+        return value
+    return coerce_enum
+
+
+def compile_validator(tool_definition: Dict) -> Callable[[Dict], Tuple[Dict, List[str]]]:
+    """
+    Build the argument validator for a tool definition once, so each call only runs
+    precomputed checks. The validator returns (arguments, errors); unknown arguments are
+    dropped, None for an optional argument means its default, and empty required values are errors.
+    """
+    parameters = tool_definition['function']['parameters']
+    required = set(parameters['required'])
+    coercers = {name: _compile_coercer(schema) for name, schema in parameters['properties'].items()}
+
+    def validate(arguments: Dict) -> Tuple[Dict, List[str]]:
+        if not isinstance(arguments, dict):
+            return {}, ["arguments must be a JSON object"]
+        valid = {}
+        errors = []
+        for name, coerce in coercers.items():
+            value = arguments.get(name)
+            if value is None or value == "":
+                if name in required:
+                    errors.append(f"missing required argument '{name}'")
+                continue
+            try:
+                valid[name] = coerce(value)
+            except ValueError as e:
+                errors.append(f"invalid argument '{name}': {e}")
+        return valid, errors
+
+    return validate
+
+
+class Tool:
+    """
+    A registered tool: the callable, its tool definition and its compiled argument validator.
+    """
+
+    def __init__(self, function: Callable, tool_definition: Dict):
+        self.name = tool_definition['function']['name']
+        self.function = function
+        self.tool_definition = tool_definition
+        self.validate = compile_validator(tool_definition)
+        self.timeout = getattr(function, "timeout", None)
+        self.category = getattr(function, "category", None)
+
+    async def invoke(self, arguments: Dict) -> Any:
+        """Run the tool with validated arguments through its awaitable interface (see custom_tool)."""
+        return await self.function.acall(**arguments)
+
+
+class ToolRegistry:
+    """
+    Tools by name. custom_tool registers every decorated function here at import time,
+    so a tool becomes available as soon as its module is imported.
+    """
+
+    def __init__(self, tools: Optional[Iterable[Tool]] = None):
+        self._tools: Dict[str, Tool] = {}
+        for tool in tools or ():
+            self.add(tool)
+
+    def add(self, tool: Tool) -> Tool:
+        self._tools[tool.name] = tool
+        return tool
+
+    def register(self, function: Callable, tool_definition: Dict) -> Tool:
+        return self.add(Tool(function, tool_definition))
+
+    def get(self, name: str) -> Optional[Tool]:
+        return self._tools.get(name)
+
+    def names(self) -> List[str]:
+        return list(self._tools)
+
+    def definitions(self) -> List[Dict]:
+        return [tool.tool_definition for tool in self._tools.values()]
+
+    def subset(self, names: Iterable[str]) -> "ToolRegistry":
+        """
+        A registry holding only the named tools, in the given order. Unknown names raise KeyError.
+        """
+        return ToolRegistry(self._tools[name] for name in names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._tools
+
+    def __len__(self) -> int:
+        return len(self._tools)
+
+
+# Every tool decorated with custom_tool
+registry = ToolRegistry()
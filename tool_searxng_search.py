@@ -1,9 +1,17 @@
-import requests
-from bs4 import BeautifulSoup
+import asyncio
+import os
+import aiohttp
 from tool_decorator import custom_tool
+from tool_cache import fold_text
+from http_pool import get_session, request_timeout
+from page_fetcher import fetch_page_summaries
 
-@custom_tool
-def search_searxng(query: str) -> str:
+CACHE_TTL = float(os.getenv('SEARCH_CACHE_TTL', '900'))  # Seconds search results are reused
+SEARXNG_URL = os.getenv('SEARXNG_URL', 'http://192.168.1.10:4000/search')  # Your SearxNG instance's search endpoint
+
+@custom_tool(cache_ttl=CACHE_TTL, cache_normalize={'query': fold_text},
+             cache_if=lambda result: not result.startswith("An error occurred"), category='search')
+async def search_searxng(query: str) -> str:
     """
     Used to search online for a query using a SearxNG instance and return the first few results with page content summaries.
 
@@ -25,7 +33,6 @@ def search_searxng(query: str) -> str:
     - **Content Analysis**: Useful for getting a quick summary of web pages to determine their relevance without needing to read through full articles.
     - **AI Integration**: Can be integrated into AI systems that require real-time access to diverse and up-to-date information from the web, such as virtual assistants, research bots, or automated content curators.
     """
-    searxng_url = "http://192.168.1.10:4000/search"  # Replace with your SearxNG instance URL
     params = {
         'q': query,
         'format': 'json',
@@ -36,44 +43,30 @@ def search_searxng(query: str) -> str:
     }
 
     try:
-        response = requests.get(searxng_url, params=params, headers=headers)
-        response.raise_for_status()
-        results = response.json()['results']
+        async with get_session().get(SEARXNG_URL, params=params, headers=headers, timeout=request_timeout()) as response:
+            response.raise_for_status()
+            results = (await response.json(content_type=None))['results']
         
         if not results:
             return "No results found."
         
+        top_results = results[:5]
+        # Fetch content of the pages concurrently
+        page_summaries = await fetch_page_summaries([result['url'] for result in top_results], headers)
+
         result_list = []
-        for index, result in enumerate(results[:5], start=1):
+        for index, (result, page_summary) in enumerate(zip(top_results, page_summaries), start=1):
             title = result['title']
             link = result['url']
-            # Fetch content of the page
-            page_summary = fetch_page_summary(link, headers)
             result_list.append(f"{index}. {title}\nLink: {link}\nSummary: {page_summary}\n")
         
         return "\n".join(result_list)
     
-    except requests.RequestException as e:
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         return f"An error occurred while performing the search: {e}"
 
-def fetch_page_summary(url: str, headers: dict) -> str:
-    """Fetch the content summary of a given URL."""
-    try:
-        response = requests.get(url, headers=headers, timeout=10)  # 10-second timeout
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Extract and return the first 300 characters of text content from the page
-        paragraphs = soup.find_all('p')
-        text = ' '.join([para.get_text() for para in paragraphs[:3]])  # Get text from the first 3 paragraphs
-        return text[:300] + '...' if text else "No summary available."
-    
-    except requests.RequestException as e:
-        return "Could not retrieve content."
-
 # # Example usage
 # query = "Python programming"
-# search_results = search_searxng(query)
+# search_results = asyncio.run(search_searxng(query))
 # if search_results:
 #     print(search_results)
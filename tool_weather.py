@@ -1,5 +1,12 @@
-import requests
+import asyncio
+import time
+from typing import List
+from urllib.parse import quote
+import aiohttp
+import json_codec
 from tool_decorator import custom_tool
+from tool_cache import LRUCache, MISSING, fold_text
+from http_pool import get_session, request_timeout
 import os
 from dotenv import load_dotenv
 
@@ -9,29 +16,71 @@ load_dotenv()
 # Constants
 API_KEY = os.getenv('VISUAL_CROSSING_API_KEY')  # Replace with your actual API key
 UNIT_GROUP = 'us'
-BASE_URL = "https://weather.visualcrossing.com/VisualCrossingWebServices/rest/services/timeline/"
+BASE_URL = os.getenv('WEATHER_API_URL', "https://weather.visualcrossing.com/VisualCrossingWebServices/rest/services/timeline/")
+REQUEST_TIMEOUT = float(os.getenv('WEATHER_TIMEOUT', '10'))
+# Forecasts change at the provider's update interval, so cached reports expire at the next update
+UPDATE_INTERVAL = float(os.getenv('WEATHER_UPDATE_INTERVAL', '900'))
+GEOCODE_TTL = float(os.getenv('WEATHER_GEOCODE_TTL', '604800'))  # Seconds a location's resolved address is remembered
+MAX_LOCATIONS = int(os.getenv('WEATHER_MAX_LOCATIONS', '10'))  # Locations per get_weather_many call
 
-@custom_tool
-def get_weather(location: str) -> str:
-    """Get the current weather in a specified location.    
+# Only today's values that end up in the report are requested
+ELEMENTS = ('datetime,description,temp,feelslike,tempmax,tempmin,precipprob,humidity,'
+            'windspeed,windgust,uvindex,sunrise,sunset')
+
+# Normalized location text -> the address the provider resolved it to, e.g. 'paris' -> 'Paris, Île-de-France, France'
+resolved_addresses = LRUCache(maxsize=10000)
+# Normalized resolved address -> the cache key its report was first stored under, so other spellings
+# of the place reuse that entry instead of moving the key once the address is known
+address_keys = LRUCache(maxsize=10000)
+
+
+def seconds_until_update() -> float:
+    """Seconds until the provider's next update, so a cached report never outlives the data it came from."""
+    return UPDATE_INTERVAL - time.time() % UPDATE_INTERVAL
+
+
+def location_key(location: str) -> str:
+    """
+    Cache key for a location: the normalized text, or, once the location is known to resolve to an
+    address that was already looked up under another spelling, that spelling's key. A key never
+    changes after its report is stored, so the first lookup of a place is not orphaned.
+    """
+    folded = fold_text(location)
+    address = resolved_addresses.get(folded)
+    # The text may itself be a resolved address, e.g. copied from an earlier report
+    key = address_keys.get(folded if address is MISSING else fold_text(address))
+    return folded if key is MISSING else key
+
+
+@custom_tool(cache_ttl=seconds_until_update, cache_normalize={'location': location_key}, category='weather')
+async def get_weather(location: str) -> str:
+    """Get the current weather in a specified location.
     Args:
-        location (str): The name of the location for which to check the weather in City, State format. 
-        
+        location (str): The name of the location for which to check the weather in City, State format.
+
     Returns:
         str: A string describing the current weather in the specified location.
     """
     params = {
         'unitGroup': UNIT_GROUP,
-        'key': API_KEY,
-        'contentType': 'json'
+        'key': API_KEY or '',
+        'contentType': 'json',
+        'include': 'days',
+        'elements': ELEMENTS,
     }
+    address = resolved_addresses.get(fold_text(location))
+    url = f"{BASE_URL}{quote(location if address is MISSING else address, safe='')}/today"
 
     try:
-        response = requests.get(f"{BASE_URL}{location}", params=params)
-        response.raise_for_status()  # Raise an exception if the request fails
-        weather_data = response.json()
+        async with get_session().get(url, params=params, timeout=request_timeout(REQUEST_TIMEOUT)) as response:
+            response.raise_for_status()  # Raise an exception if the request fails
+            weather_data = json_codec.loads(await response.read())
 
-        today_weather = weather_data['days'][0]    
+        folded = fold_text(location)
+        resolved_addresses.set(folded, weather_data['resolvedAddress'], GEOCODE_TTL)
+        if address_keys.get(fold_text(weather_data['resolvedAddress'])) is MISSING:
+            address_keys.set(fold_text(weather_data['resolvedAddress']), folded, GEOCODE_TTL)
+        today_weather = weather_data['days'][0]
 
         fun_response = (
             f"Here's the weather for {weather_data['resolvedAddress']} today:\n\n"
@@ -45,14 +94,32 @@ def get_weather(location: str) -> str:
             f"Sunrise is at {today_weather['sunrise']} and sunset is at {today_weather['sunset']}"
         )
         return fun_response
-    
-    except requests.RequestException as e:
+
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         print(f"An error occurred while fetching the weather data: {e}")
         return None
 
+
+@custom_tool(category='weather')
+async def get_weather_many(locations: List[str]) -> str:
+    """Get the current weather in several locations at once, e.g. to compare them.
+    Args:
+        locations (list): The names of the locations to check the weather in, each in City, State format.
+
+    Returns:
+        str: The current weather in each location.
+    """
+    # Repeated mentions of one place are looked up once
+    unique = list({location_key(location): location for location in locations}.values())[:MAX_LOCATIONS]
+    reports = await asyncio.gather(*(get_weather(location) for location in unique), return_exceptions=True)
+    return "\n\n".join(
+        report if isinstance(report, str) else f"Could not retrieve the weather for {location}."
+        for location, report in zip(unique, reports)
+    )
+
 # Example usage
 # location = 'Woodbury, MN'
-# weather_info = get_weather(location)
+# weather_info = asyncio.run(get_weather(location))
 # if weather_info:
 #     print(f"Weather description for {location}:")
-#     print(weather_info)
\ No newline at end of file
+#     print(weather_info)
@@ -1,34 +1,181 @@
-import wikipediaapi
+import os
+import threading
+from collections import OrderedDict
+from typing import List
+import requests
+from requests.adapters import HTTPAdapter
 from tool_decorator import custom_tool
+from tool_cache import MISSING, fold_text, tool_caches
 
-@custom_tool
+CACHE_TTL = float(os.getenv('WIKIPEDIA_CACHE_TTL', '86400'))  # Seconds a summary is reused
+API_URL = os.getenv('WIKIPEDIA_API_URL', 'https://en.wikipedia.org/w/api.php')
+USER_AGENT = 'WeatherChatAgent/1.0 (mukul@example.com)'
+MAX_TITLES_PER_QUERY = 20  # MediaWiki limit for intro extracts in one request
+MAX_QUERIES = int(os.getenv('WIKIPEDIA_MAX_QUERIES', '10'))  # Queries per lookup_wikipedia_many call
+
+
+class WikipediaClient:
+    """
+    Long-lived MediaWiki API client.
+
+    A single pooled requests.Session is shared by every lookup, existence and intro extract are fetched
+    in one query, and the title each query resolved to (after normalization and redirects) is remembered
+    so repeat lookups go straight to the canonical page.
+    """
+
+    def __init__(self, api_url: str = API_URL, user_agent: str = USER_AGENT, pool_size: int = 10,
+                 timeout: float = 10.0, max_resolved_titles: int = 10000):
+        self.api_url = api_url
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = user_agent
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.max_resolved_titles = max_resolved_titles
+        self._resolved_titles: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _resolved(self, title: str) -> str:
+        with self._lock:
+            resolved = self._resolved_titles.get(title)
+            if resolved is not None:
+                self._resolved_titles.move_to_end(title)
+        return resolved or title
+
+    def _remember(self, title: str, resolved: str):
+        if title == resolved:
+            return
+        with self._lock:
+            self._resolved_titles[title] = resolved
+            self._resolved_titles.move_to_end(title)
+            while len(self._resolved_titles) > self.max_resolved_titles:
+                self._resolved_titles.popitem(last=False)
+
+    def summaries(self, titles):
+        """
+        Look up the intro extract of several titles, batching them into as few API queries as possible.
+
+        Returns a dict mapping each requested title to (resolved_title, extract), where extract is None
+        if no page exists.
+        """
+        results = {}
+        lookups = {title: self._resolved(title) for title in dict.fromkeys(titles)}
+        pending = list(dict.fromkeys(lookups.values()))
+        found = {}
+        for start in range(0, len(pending), MAX_TITLES_PER_QUERY):
+            found.update(self._query(pending[start:start + MAX_TITLES_PER_QUERY]))
+        for title, lookup_title in lookups.items():
+            resolved, extract = found.get(lookup_title, (lookup_title, None))
+            if extract is not None:
+                self._remember(title, resolved)
+            results[title] = (resolved, extract)
+        return results
+
+    def summary(self, title):
+        """Look up the intro extract of a single title, see summaries."""
+        return self.summaries([title])[title]
+
+    def _query(self, titles):
+        params = {
+            'action': 'query',
+            'format': 'json',
+            'formatversion': 2,
+            'prop': 'extracts',
+            'exintro': 1,
+            'explaintext': 1,
+            'exlimit': 'max',
+            'redirects': 1,
+            'titles': '|'.join(titles),
+        }
+        response = self.session.get(self.api_url, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        query = response.json().get('query', {})
+
+        # Follow the chain title -> normalized title -> redirect target for every requested title
+        renames = {}
+        for item in query.get('normalized', []) + query.get('redirects', []):
+            renames[item['from']] = item['to']
+        pages = {page['title']: page for page in query.get('pages', [])}
+
+        found = {}
+        for title in titles:
+            resolved = title
+            for _ in range(3):
+                if resolved not in renames:
+                    break
+                resolved = renames[resolved]
+            page = pages.get(resolved)
+            if page is None or page.get('missing') or page.get('invalid'):
+                found[title] = (resolved, None)
+            else:
+                found[title] = (resolved, page.get('extract', ''))
+        return found
+
+
+# Shared by every lookup for the lifetime of the process
+wiki_client = WikipediaClient()
+
+
+def format_summary(query, summary):
+    if summary is None:
+        return f"No Wikipedia page found for '{query}'."
+    return f"Wikipedia summary for '{query}':\n\n{summary[:500]}"  # Limit the summary length
+
+
+@custom_tool(cache_ttl=CACHE_TTL, cache_normalize={'query': fold_text}, category='encyclopedia')
 def lookup_wikipedia(query: str) -> str:
     """Look up information on Wikipedia.
-    
+
     Args:
         query (str): The search term to look up on Wikipedia.
-        
+
     Returns:
         str: A summary of the information found on Wikipedia.
     """
-    # Set the custom user agent
-    user_agent = 'WeatherChatAgent/1.0 (mukul@example.com)'
-    
-    # Initialize the Wikipedia API with custom User-Agent
-    wiki_wiki = wikipediaapi.Wikipedia(
-        language='en',
-        user_agent=user_agent
-    )
-    
-    # Look up the page
-    page = wiki_wiki.page(query)
-
-    if not page.exists():
-        return f"No Wikipedia page found for '{query}'."
+    try:
+        _, summary = wiki_client.summary(query)
+    except requests.RequestException as e:
+        print(f"An error occurred while looking up Wikipedia: {e}")
+        return None
+
+    return format_summary(query, summary)
+
+
+@custom_tool(category='encyclopedia')
+def lookup_wikipedia_many(queries: List[str]) -> str:
+    """Look up several topics on Wikipedia at once, e.g. to compare them.
+
+    Args:
+        queries (list): The search terms to look up on Wikipedia.
+
+    Returns:
+        str: A summary of the information found on Wikipedia for each search term.
+    """
+    # Repeated mentions of one topic are looked up once
+    unique = list({fold_text(query): query for query in queries}.values())[:MAX_QUERIES]
+
+    # Topics looked up recently come from lookup_wikipedia's cache, the rest from one batched API query
+    cache = tool_caches.get('lookup_wikipedia')
+    keys = {query: cache.make_key((query,), {}) for query in unique} if cache else {}
+    results = {}
+    for query in unique:
+        value = cache.backend.get(keys[query]) if cache else MISSING
+        if value is not MISSING:
+            results[query] = value
+    missing = [query for query in unique if query not in results]
+    if missing:
+        try:
+            found = wiki_client.summaries(missing)
+        except requests.RequestException as e:
+            print(f"An error occurred while looking up Wikipedia: {e}")
+            found = {}
+        for query, (_, summary) in found.items():
+            results[query] = format_summary(query, summary)
+            if cache:
+                cache.backend.set(keys[query], results[query], CACHE_TTL)
 
-    # Get a summary of the page content
-    summary = page.summary[:500]  # Limit the summary length
-    return f"Wikipedia summary for '{query}':\n\n{summary}"
+    return "\n\n".join(results.get(query) or f"Could not look up '{query}' on Wikipedia." for query in unique)
 
 # Example usage
 # query = 'Artificial Intelligence'
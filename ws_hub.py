@@ -0,0 +1,312 @@
+# ws_hub.py
+import asyncio
+import os
+import socket
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Set
+
+from fastapi import WebSocket
+
+import json_codec
+from telemetry import metrics
+
+# Sent to every connection on each heartbeat; clients answer with PONG_FRAME
+PING_FRAME = '{"type":"ping"}'
+PONG_FRAME = '{"type":"pong"}'
+
+# Largest message forwarded between worker processes in one datagram
+MAX_DATAGRAM = 1 << 18
+
+# Close codes (RFC 6455): 1001 going away, 1008 policy violation (send queue overflow)
+CLOSE_GOING_AWAY = 1001
+CLOSE_TOO_SLOW = 1008
+
+WS_SEND_SECONDS = metrics.histogram("ws_send_seconds", "Duration of sending one message to a WebSocket",
+                                    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0))
+WS_DROPPED = metrics.counter("ws_slow_clients_dropped_total", "WebSockets closed because their send queue was full")
+
+
+class Connection:
+    """
+    One WebSocket with its own bounded send queue, drained by a background task so a slow client
+    never blocks the code producing messages. A client whose queue fills up is disconnected.
+    """
+
+    def __init__(self, websocket: WebSocket, session_id: str, queue_size: int, send_timeout: float,
+                 on_close: Callable[["Connection"], None]):
+        self.websocket = websocket
+        self.session_id = session_id
+        self.send_timeout = send_timeout
+        self.last_seen = time.monotonic()
+        self.closed = False
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._on_close = on_close
+        self._sender = asyncio.create_task(self._drain())
+
+    def offer(self, message: str) -> bool:
+        """Queue a message without waiting. Returns False if the connection was dropped instead."""
+        if self.closed:
+            return False
+        try:
+            self._queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            print(f"Dropping slow WebSocket client of session {self.session_id}")
+            WS_DROPPED.inc()
+            self.close(CLOSE_TOO_SLOW)
+            return False
+
+    def touch(self):
+        self.last_seen = time.monotonic()
+
+    async def _drain(self):
+        try:
+            while True:
+                message = await self._queue.get()
+                started = time.monotonic()
+                await asyncio.wait_for(self.websocket.send_text(message), self.send_timeout)
+                WS_SEND_SECONDS.observe(time.monotonic() - started)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"WebSocket send failed for session {self.session_id}: {e}")
+        self.close()
+
+    def close(self, code: int = CLOSE_GOING_AWAY):
+        if self.closed:
+            return
+        self.closed = True
+        self._on_close(self)
+        if asyncio.current_task() is not self._sender:
+            self._sender.cancel()
+        asyncio.create_task(self._close_socket(code))
+
+    async def _close_socket(self, code: int):
+        try:
+            await asyncio.wait_for(self.websocket.close(code), self.send_timeout)
+        except Exception:
+            pass  # Already closed by the client
+
+
+class PubSubBackend:
+    """
+    Delivers messages published for a session to every worker process, each of which
+    forwards them to the WebSockets it owns for that session.
+    """
+
+    async def start(self, deliver: Callable[[str, str], None]):
+        """Begin delivering published messages to deliver(session_id, message)."""
+        raise NotImplementedError
+
+    def publish(self, session_id: str, message: str):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class InProcessPubSub(PubSubBackend):
+    """
+    Single-process backend: publishing delivers straight to this process's connections.
+    """
+
+    def __init__(self):
+        self._deliver: Optional[Callable[[str, str], None]] = None
+
+    async def start(self, deliver):
+        self._deliver = deliver
+
+    def publish(self, session_id, message):
+        if self._deliver:
+            self._deliver(session_id, message)
+
+
+class UnixSocketPubSub(PubSubBackend):
+    """
+    Backend for several worker processes on one host. Each worker binds a Unix datagram socket in a
+    shared directory; publishing delivers locally and sends one datagram to every sibling socket there.
+    Sockets of workers that have exited are removed the first time a send to them is refused, and
+    a sibling whose receive buffer is full misses the message rather than blocking the sender.
+
+    The list of siblings is read from the directory at most every refresh_interval seconds, and again
+    after a send fails. A starting worker sends every sibling an empty datagram, so they list the
+    directory again on their next publish instead of missing the new worker until the interval passes.
+    """
+
+    def __init__(self, directory: str, refresh_interval: float = 5.0):
+        self.directory = directory
+        self.refresh_interval = refresh_interval
+        self.path = os.path.join(directory, f"{os.getpid()}.sock")
+        self._deliver: Optional[Callable[[str, str], None]] = None
+        self._receiver: Optional[socket.socket] = None
+        self._sender: Optional[socket.socket] = None
+        self._siblings: List[str] = []
+        self._listed_at = float("-inf")
+
+    async def start(self, deliver):
+        self._deliver = deliver
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._receiver.bind(self.path)
+        self._receiver.setblocking(False)
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.setblocking(False)
+        asyncio.get_running_loop().add_reader(self._receiver.fileno(), self._receive)
+        for path in self._list_siblings():
+            self._send(b"", path)
+
+    def _list_siblings(self) -> List[str]:
+        now = time.monotonic()
+        if now - self._listed_at >= self.refresh_interval:
+            paths = (os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".sock"))
+            self._siblings = [path for path in paths if path != self.path]
+            self._listed_at = now
+        return self._siblings
+
+    def _receive(self):
+        while True:
+            try:
+                data = self._receiver.recv(MAX_DATAGRAM)
+            except (BlockingIOError, InterruptedError):
+                return
+            if not data:
+                # A new worker announced itself
+                self._listed_at = float("-inf")
+                continue
+            try:
+                session_id, message = json_codec.loads(data)
+            except json_codec.DecodeError + (TypeError,):
+                continue
+            self._deliver(session_id, message)
+
+    def publish(self, session_id, message):
+        self._deliver(session_id, message)
+        siblings = self._list_siblings()
+        if not siblings:
+            return
+        data = json_codec.dumps([session_id, message])
+        for path in siblings:
+            self._send(data, path)
+
+    def _send(self, data: bytes, path: str):
+        try:
+            self._sender.sendto(data, path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            self._remove_stale(path)
+            # The worker may have been replaced by one with another socket
+            self._listed_at = float("-inf")
+        except OSError as e:
+            print(f"Could not forward WebSocket message to {path}: {e}")
+
+    @staticmethod
+    def _remove_stale(path: str):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    async def close(self):
+        if self._receiver is not None:
+            asyncio.get_running_loop().remove_reader(self._receiver.fileno())
+            self._receiver.close()
+            self._sender.close()
+            self._receiver = self._sender = None
+            self._remove_stale(self.path)
+
+
+class ConnectionHub:
+    """
+    WebSocket connections by session. A session may have any number of sockets (e.g. several tabs),
+    and every message for the session goes to all of them, in whichever worker process owns them.
+    A heartbeat pings every socket and closes those that have not been heard from within idle_timeout.
+    """
+
+    def __init__(self, pubsub: Optional[PubSubBackend] = None, queue_size: int = 256, send_timeout: float = 10.0,
+                 heartbeat_interval: float = 20.0, idle_timeout: float = 60.0):
+        self.pubsub = pubsub or InProcessPubSub()
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self.active_connections: Dict[str, Set[Connection]] = {}
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    async def start(self):
+        await self.pubsub.start(self._deliver_local)
+        if self.heartbeat_interval:
+            self._heartbeat = asyncio.create_task(self._run_heartbeat())
+
+    async def close(self):
+        if self._heartbeat:
+            self._heartbeat.cancel()
+        for connections in list(self.active_connections.values()):
+            for connection in list(connections):
+                connection.close()
+        await self.pubsub.close()
+
+    async def connect(self, websocket: WebSocket, session_id: str) -> Connection:
+        await websocket.accept()
+        connection = Connection(websocket, session_id, self.queue_size, self.send_timeout, self._forget)
+        self.active_connections.setdefault(session_id, set()).add(connection)
+        return connection
+
+    def disconnect(self, connection: Connection):
+        connection.close()
+
+    def _forget(self, connection: Connection):
+        connections = self.active_connections.get(connection.session_id)
+        if connections is not None:
+            connections.discard(connection)
+            if not connections:
+                del self.active_connections[connection.session_id]
+
+    async def send_personal_message(self, message: str, session_id: str):
+        """
+        Queue a message for every socket of the session. Never waits for the clients.
+        """
+        self.pubsub.publish(session_id, message)
+
+    def _deliver_local(self, session_id: str, message: str):
+        for connection in list(self.active_connections.get(session_id, ())):
+            connection.offer(message)
+
+    async def _run_heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            idle_before = time.monotonic() - self.idle_timeout
+            for connections in list(self.active_connections.values()):
+                for connection in list(connections):
+                    if self.idle_timeout and connection.last_seen < idle_before:
+                        connection.close()
+                    else:
+                        connection.offer(PING_FRAME)
+
+    def stats(self) -> Dict:
+        return {
+            "sessions": len(self.active_connections),
+            "connections": sum(len(connections) for connections in self.active_connections.values()),
+        }
+
+
+def create_connection_hub() -> ConnectionHub:
+    """
+    Build the hub with the pub/sub backend selected by WS_BACKEND ('memory' or 'unix').
+    """
+    backend = os.getenv("WS_BACKEND", "memory").lower()
+    if backend == "unix":
+        directory = os.getenv("WS_SOCKET_DIR", os.path.join(tempfile.gettempdir(), "basic-agent-chat-ws"))
+        pubsub = UnixSocketPubSub(directory, refresh_interval=float(os.getenv("WS_PEER_REFRESH", "5")))
+    elif backend == "memory":
+        pubsub = InProcessPubSub()
+    else:
+        raise ValueError(f"Unknown WS_BACKEND: {backend}")
+    return ConnectionHub(
+        pubsub,
+        queue_size=int(os.getenv("WS_SEND_QUEUE", "256")),
+        send_timeout=float(os.getenv("WS_SEND_TIMEOUT", "10")),
+        heartbeat_interval=float(os.getenv("WS_HEARTBEAT_INTERVAL", "20")),
+        idle_timeout=float(os.getenv("WS_IDLE_TIMEOUT", "60")),
+    )